@@ -0,0 +1,60 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""Benchmark of scheme 2 (wind erosion of piles) on a long met record.
+
+Usage:
+    python -m benchmarks.bench_scheme2 --hours 1000000
+"""
+
+import argparse
+import time
+
+from medea.factor import scheme2
+
+from .synthetic import synthetic_met
+
+SOURCES = {
+    "asymmetric": {
+        "id": 1,
+        "scheme": 2,
+        "species": ["PTS", "PM25", "PM10"],
+        "height": 1,
+        "major": 5,
+        "minor": 3,
+        "angle": 10,
+        "roughness": 0.3,
+        "tfv": 0.05,
+    },
+    "conical": {
+        "id": 2,
+        "scheme": 2,
+        "species": ["PTS", "PM25", "PM10"],
+        "height": 4,
+        "radius": 3,
+        "roughness": 0.15,
+        "tfv": 0.05,
+    },
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--hours", type=int, default=10**6)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    met = synthetic_met(args.hours)
+    for shape, sou in SOURCES.items():
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            scheme2(met, [sou])
+            best = min(best, time.perf_counter() - start)
+        print(f"scheme2 {shape:<10s} {args.hours:>9d} hours: {best:8.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""Time the medea pipeline stages on synthetic inputs.
+
+Usage:
+    python -m benchmarks.run --hours 8760 --sources 30 --species 4
+    python -m benchmarks.run --output new.json --compare old.json
+"""
+
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from importlib.metadata import version
+from pathlib import Path
+
+from medea import emifile
+from medea.medea import readconf
+from medea.met import readmet, writemet
+
+from .synthetic import generate
+
+MODES = ["spray", "calpuff", "impact", "aermod"]
+WRITERS = {
+    "spray": emifile.pemtim,
+    "calpuff": emifile.calpuff,
+    "impact": emifile.impact,
+    "aermod": emifile.aermod,
+}
+
+
+# commands run by fresh interpreters to measure startup time
+STARTUP = {
+    "startup.import": ["-c", "import medea"],
+    "startup.import_cli": ["-c", "import medea.medea"],
+    "startup.help": ["-m", "medea", "--help"],
+}
+
+
+def countlines(path):
+    """Number of lines of a text file."""
+    with open(path, "rb") as f:
+        return sum(1 for line in f)
+
+
+def measure(func, *args, memory=True):
+    """Wall time and peak traced memory of a function call."""
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        tracemalloc.start()
+        func(*args)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def stage(results, name, rows, seconds, peak):
+    """Store and print the measurements of a stage."""
+    results[name] = {
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds if seconds > 0 else None,
+        "peak_mib": peak,
+    }
+    rate = results[name]["rows_per_second"] or 0.0
+    mem = f"{peak:9.1f} MiB" if peak is not None else ""
+    print(f"{name:<20s} {seconds:9.3f} s {rate:12.0f} rows/s {mem}")
+
+
+def startup(repeat=5):
+    """Best wall time of fresh interpreters importing medea."""
+    results = {}
+    for name, argv in STARTUP.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *argv], check=True, capture_output=True)
+            best = min(best, time.perf_counter() - start)
+        stage(results, name, 1, best, None)
+    return results
+
+
+def bench(folder, args):
+    """Run all pipeline stages for every model."""
+    results = {}
+    for mode in args.modes:
+        config = generate(
+            Path(folder) / mode,
+            args.hours,
+            args.sources,
+            args.species,
+            mode,
+            args.mettype,
+        )
+        conf, seconds, peak = measure(readconf, config, memory=args.memory)
+        stage(results, f"{mode}.readconf", len(conf["sources"]), seconds, peak)
+        met, seconds, peak = measure(readmet, conf, memory=args.memory)
+        stage(results, f"{mode}.readmet", len(met), seconds, peak)
+        metout, seconds, peak = measure(writemet, conf, met.copy(), memory=args.memory)
+        rows = len(met) * len(conf["sources"])
+        stage(results, f"{mode}.writemet", rows, seconds, peak)
+        _, seconds, peak = measure(WRITERS[mode], conf, metout, memory=args.memory)
+        rows = countlines(conf["input"])
+        stage(results, f"{mode}.{WRITERS[mode].__name__}", rows, seconds, peak)
+    return results
+
+
+def compare(results, reference):
+    """Print the ratio of wall times with respect to a reference run."""
+    print(f"\n{'stage':<20s} {'reference':>11s} {'current':>11s} {'ratio':>7s}")
+    for name, res in results.items():
+        if name not in reference["stages"]:
+            continue
+        ref = reference["stages"][name]["seconds"]
+        print(
+            f"{name:<20s} {ref:9.3f} s {res['seconds']:9.3f} s"
+            f" {res['seconds'] / ref:7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark medea pipeline.")
+    parser.add_argument("--hours", type=int, default=8760)
+    parser.add_argument("--sources", type=int, default=30)
+    parser.add_argument("--species", type=int, default=4)
+    parser.add_argument("--mettype", choices=["csv", "postbin"], default="csv")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Skip the traced run measuring peak memory",
+    )
+    parser.add_argument("--output", type=Path, help="Save results to JSON file")
+    parser.add_argument("--compare", type=Path, help="Reference JSON results")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    results = startup()
+    with tempfile.TemporaryDirectory() as folder:
+        results |= bench(folder, args)
+
+    report = {
+        "medea": version("medea"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parameters": {
+            "hours": args.hours,
+            "sources": args.sources,
+            "species": args.species,
+            "mettype": args.mettype,
+        },
+        "stages": results,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text()))
+
+
+if __name__ == "__main__":
+    main()
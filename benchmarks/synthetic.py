@@ -0,0 +1,233 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""Synthetic meteorological and emission files for benchmarks."""
+
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# first deadline of all synthetic files
+START = datetime(2019, 1, 1)
+
+# dust species required by schemes 2 and 3
+DUST = ["PM25", "PM10", "PTS"]
+
+
+def species(nspe):
+    """Species of synthetic emission files (at least dust and odour)."""
+    return DUST + ["OU"] + [f"X{i}" for i in range(max(0, nspe - 4))]
+
+
+def synthetic_met(hours, seed=0):
+    """Hourly met record with random wind speed, direction and stability."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "date": pd.date_range(START, periods=hours, freq="h"),
+            "ws": np.round(rng.gamma(2.0, 2.0, hours), 2),
+            "wd": np.round(rng.uniform(0.0, 360.0, hours)),
+            "stabclass": rng.choice(list("ABCDEF"), hours),
+            "z": np.full(hours, 10.0),
+        }
+    )
+
+
+def sources(nsou, schemes=(1, 2, 3)):
+    """Source definitions cycling over the given schemes."""
+    lsou = []
+    for i in range(nsou):
+        scheme = schemes[i % len(schemes)]
+        sou = {"id": f"S{i}", "scheme": scheme, "height": 2 + i % 5}
+        if scheme == 1:
+            sou.update(species=["OU"], terrain=["rural", "urban"][i % 2])
+        elif scheme == 2:
+            sou.update(species=DUST, roughness=0.3, tfv=0.05)
+            if i % 2:
+                sou.update(radius=3 + i % 4)
+            else:
+                sou.update(height=1, major=50, minor=30, angle=i % 181 - 90)
+        else:
+            sou.update(species=DUST, radius=3.6, movh=4)
+        lsou.append(sou)
+    return lsou
+
+
+def tomlvalue(value):
+    """Format a value as toml."""
+    if isinstance(value, str):
+        return f'"{value}"'
+    if isinstance(value, list):
+        return "[" + ", ".join(tomlvalue(v) for v in value) + "]"
+    return str(value)
+
+
+def writeconf(path, conf):
+    """Write a configuration file in toml format."""
+    lines = []
+    for key, value in conf.items():
+        if key == "sources":
+            continue
+        lines.append(f"{key} = {tomlvalue(value)}")
+    lines.append("sources = [")
+    for sou in conf["sources"]:
+        items = ", ".join(f"{k} = {tomlvalue(v)}" for k, v in sou.items())
+        lines.append(f"    {{ {items} }},")
+    lines.append("]")
+    Path(path).write_text("\n".join(lines) + "\n")
+
+
+def writecsv(path, met):
+    """Write a csv meteo file."""
+    met.to_csv(path, index=False, date_format="%Y-%m-%dT%H:%M:%SZ")
+
+
+def writepostbin(path, met):
+    """Write a postbin meteo file."""
+    date = met["date"].dt
+    cols = [
+        np.ones(len(met)),
+        np.ones(len(met)),
+        date.day,
+        date.month,
+        date.year - 2000,
+        date.hour,
+        date.minute,
+        date.second,
+    ]
+    with open(path, "w") as f:
+        for row in zip(*cols, met["z"], met["ws"], met["wd"], met["ws"]):
+            f.write(
+                "".join(f"{v:5.0f}." for v in row[:8])
+                + "".join(f" {v:12.5E}" for v in row[8:])
+                + "\n"
+            )
+
+
+def writepemtim(path, pemspe, lsou, lspe, hours):
+    """Write pemtim and pemspe files with hourly periods."""
+    with open(pemspe, "w") as f:
+        f.write("* ------------------------------\n")
+        f.write(f"{len(lspe):12d}\n{1:12d}\n")
+        for k, spe in enumerate(lspe):
+            f.write(f"{k + 1:3d}*{spe:<8s}* 901* 0*0.00000* 0.00E+00*\n")
+        f.write("* ------------------------------\n")
+    specie = "".join(
+        f"{k + 1:3d}#{spe:<8s}#0.100E+10# 901#\n" for k, spe in enumerate(lspe)
+    )
+    with open(path, "w") as f:
+        f.write(f"{900:12d}\n{len(lsou):12d}{5:12d}\nMCG.\n{1:12d}\n")
+        f.write("  0.0000000E+00  0.0000000E+00\n")
+        f.write(f"{1:13d}{1:3d}{START.year - 2000:3d}  0  0  0\n")
+        for isou, sou in enumerate(lsou):
+            f.write(f"{sou:9d}#STR     #{isou + 1:<8d}#synthetic       #\n")
+            f.write(f"{hours:9d}#\n")
+            for iper in range(1, hours + 1):
+                f.write(f"#{iper:8d}#  1# 0# 0#\n")
+                if iper == 1:
+                    f.write("         # 408812.#4957620.#   1.5#   1#    2#\n")
+                    f.write("         # 408744.#4957575.#   1.5#\n")
+                    f.write("         #    81.5#    36.0#   3.0#\n")
+                f.write(specie)
+
+
+def writecalpuff(path, lsou, lspe, hours):
+    """Write a calpuff emissions input with hourly time blocks."""
+    names = [f"'{sou}'".ljust(15) for sou in lsou]
+    with open(path, "w") as f:
+        f.write("PTEMARB.DAT 2.1 Synthetic\n1\nSynthetic\nUTM\n19N\n")
+        f.write("NAS-C 02-21-2003\nKM\nUTC-0500\n")
+        f.write(f"{START.year} 1 0 0000 {START.year} 1 23 3600\n")
+        f.write(f"{len(lsou)} {len(lspe)}\n")
+        f.write(" ".join(f"'{spe}'" for spe in lspe) + "\n")
+        f.write("30.000 30.000\n")
+        for name in names:
+            f.write(f"{name} 0.13489 0.00360 18.600 9.754 88.70 1.00 1.00 0.00\n")
+        emis = " ".join("0.468814E+01" for spe in lspe)
+        for k in range(hours):
+            date = START + timedelta(hours=k)
+            jday = date.timetuple().tm_yday
+            stamp = f"{date.year} {jday:02d} {date.hour:02d} 0000"
+            f.write(f"{stamp} {date.year} {jday:02d} {date.hour:02d} 3600\n")
+            for name in names:
+                f.write(f"{name} 280.55 8.66 0.0 0.0 {emis}\n")
+
+
+def writeimpact(path, lsou, lspe, hours):
+    """Write an impact emissions input with hourly lines for each source."""
+    date = pd.date_range(START, periods=hours + 1, freq="h")
+    text = date.strftime("%d-%m-%Y %H:%M:%S")
+    deb = text[:-1]
+    fin = text[1:]
+    frames = []
+    for sou in lsou:
+        frame = pd.DataFrame({"SRCEID": sou, "DATEDEB": deb, "DATEFIN": fin})
+        for spe in lspe:
+            frame["Q_" + spe] = 13500000.0
+        frames.append(frame)
+    pd.concat(frames).to_csv(path, sep=";", index=False, float_format="%.2f")
+
+
+def writeaermod(path, lsou, hours):
+    """Write an aermod hourly emissions input for each source."""
+    with open(path, "w") as f:
+        for k in range(hours):
+            date = START + timedelta(hours=k)
+            stamp = (
+                f"SO HOUREMIS {date.year - 2000:3d}{date.month:3d}"
+                f"{date.day:3d}{date.hour + 1:3d}"
+            )
+            for sou in lsou:
+                f.write(f"{stamp} {sou:<7s} 175.605  403.160   14.123\n")
+
+
+def generate(folder, hours, nsou, nspe, mode, mettype="csv"):
+    """Generate met, emission and configuration files for a model."""
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    # aermod deadlines end one hour after the last emission line
+    met = synthetic_met(hours + 1)
+    if mettype == "postbin":
+        windinput = folder / "met.dat"
+        writepostbin(windinput, met)
+    else:
+        windinput = folder / "met.csv"
+        writecsv(windinput, met)
+
+    lspe = species(nspe)
+    if mode == "calpuff":
+        # calpuff sources need factors for all the species of the file
+        lsou = sources(nsou, schemes=(2, 3))
+        lspe = DUST
+    else:
+        lsou = sources(nsou)
+    if mode == "spray":
+        # pemtim source identifiers are integer numbers
+        for i, sou in enumerate(lsou):
+            sou["id"] = 1000001 + i
+    ids = [sou["id"] for sou in lsou]
+
+    conf = {
+        "mode": mode,
+        "input": str(folder / f"{mode}.in"),
+        "output": str(folder / f"{mode}.out"),
+        "mettype": mettype,
+        "windInputFile": str(windinput),
+        "windOutputFile": str(folder / "metout.csv"),
+    }
+    if mode == "spray":
+        conf["pemspe"] = str(folder / "pemspe")
+        writepemtim(conf["input"], conf["pemspe"], ids, lspe, hours)
+    elif mode == "calpuff":
+        writecalpuff(conf["input"], ids, lspe, hours)
+    elif mode == "impact":
+        writeimpact(conf["input"], ids, lspe, hours)
+    elif mode == "aermod":
+        writeaermod(conf["input"], ids, hours)
+    conf["sources"] = lsou
+    writeconf(folder / "config.toml", conf)
+    return folder / "config.toml"
@@ -0,0 +1,39 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .api import compute_factors, rewrite
+    from .medea import readconf
+    from .met import loadfactors, readmet, writemet
+
+# public functions, imported on first use to keep the command line fast
+EXPORTS = {
+    "compute_factors": "api",
+    "loadfactors": "met",
+    "readconf": "medea",
+    "readmet": "met",
+    "rewrite": "api",
+    "writemet": "met",
+}
+
+__all__ = [
+    "compute_factors",
+    "loadfactors",
+    "readconf",
+    "readmet",
+    "rewrite",
+    "writemet",
+]
+
+
+def __getattr__(name):
+    if name not in EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+
+    return getattr(import_module(f".{EXPORTS[name]}", __name__), name)
@@ -0,0 +1,85 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import io
+import logging
+from copy import deepcopy
+
+import pandas as pd
+
+from .emifile import impactframe
+from .factor import expandfactors, factorpositions, factors
+from .medea import check_model, checksources, writetarget
+from .met import checkdates, metframe, readmet
+from .sources import routing
+
+
+def compute_factors(met, sources, mettype="csv"):
+    """Meteo data with the rescaling factors of all sources, in memory."""
+    logger = logging.getLogger()
+    logger.debug("{}".format(compute_factors.__doc__))
+
+    sources = checksources(deepcopy(list(sources)))
+    if isinstance(met, pd.DataFrame):
+        met = met.copy()
+        if "date" not in met.keys():
+            # deadlines given as index of the data frame
+            met["date"] = met.index
+        met = metframe(met.reset_index(drop=True), "csv")
+        checkdates(met.index, "meteorological data")
+    else:
+        # path or file-like object of a meteo file
+        met = readmet({"windInputFile": met, "mettype": mettype})
+
+    fac = factors(met, sources)
+
+    # one column per source and species, as in the output meteo file
+    columns, pos = factorpositions(fac, sources)
+    fac = pd.DataFrame(
+        expandfactors(fac)[:, pos], index=fac.index, columns=pd.Index(columns)
+    )
+    out = pd.concat([met, fac], axis=1, copy=False)
+    out.attrs["sources"] = sources
+    return out
+
+
+def rewrite(model, emissions, factors, sources=None, pemspe=None, workers=1):
+    """Rescale an emission file of a model with factors computed in memory."""
+    logger = logging.getLogger()
+    logger.debug("{}".format(rewrite.__doc__))
+
+    model = check_model(model)
+    if sources is None:
+        if "sources" not in factors.attrs:
+            raise ValueError(
+                "Sources are required for factors not from compute_factors."
+            )
+        sources = factors.attrs["sources"]
+    else:
+        sources = checksources(deepcopy(list(sources)))
+
+    if model == "impact":
+        # Impact emissions are a table, returned as a data frame
+        if isinstance(emissions, pd.DataFrame):
+            file = emissions.copy()
+        else:
+            file = pd.read_csv(emissions, sep=";")
+        return impactframe(file, sources, factors, routing(sources))
+
+    conf = {
+        "mode": model,
+        "input": emissions,
+        "output": io.StringIO(),
+        "sources": sources,
+        "routing": routing(sources),
+        "workers": workers,
+    }
+    if model == "spray":
+        if pemspe is None:
+            raise ValueError("The pemspe file is required for spray.")
+        conf["pemspe"] = pemspe
+    writetarget(model, conf, factors)
+    return conf["output"].getvalue()
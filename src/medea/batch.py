@@ -0,0 +1,158 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from pathlib import Path
+
+from .medea import readconf, run, setlogger
+
+# meteo data loaded once and shared by all scenarios of a process
+METS = {}
+# deadlines of the meteo data, read once for the pre-flight checks
+DATES = {}
+
+
+def metkey(conf):
+    """Key of the meteo data of a configuration."""
+    mettype = str(conf["mettype"]).lower() if "mettype" in conf.keys() else "csv"
+    return (str(Path(conf["windInputFile"]).resolve()), mettype)
+
+
+def loadmet(conf):
+    """Meteo data of a configuration, read only once per process."""
+    from .met import readmet
+
+    key = metkey(conf)
+    if key not in METS:
+        METS[key] = readmet(conf)
+    return METS[key]
+
+
+def loaddates(conf):
+    """Deadlines of the meteo data of a configuration, read only once."""
+    from .met import metdates
+
+    key = metkey(conf)
+    if key not in DATES:
+        DATES[key] = metdates(conf)
+    return DATES[key]
+
+
+def runconfig(path, conf):
+    """Run a single scenario and return its status."""
+    logger = logging.getLogger()
+    start = time.perf_counter()
+    status = {"config": str(path), "status": "ok", "message": "", "seconds": 0.0}
+    try:
+        logger.info(f"Running scenario {path}.")
+        if "chunkSize" in conf.keys():
+            from .met import readmetchunks
+
+            met = readmetchunks(conf, int(conf["chunkSize"]))
+        else:
+            met = loadmet(conf)
+        status["mode"] = ", ".join(run(conf, met))
+    except Exception as e:
+        status["status"] = "failed"
+        status["message"] = f"{e}"
+        logger.error(f"Scenario {path} failed: {status['message']}")
+    status["seconds"] = time.perf_counter() - start
+    return status
+
+
+def batch(argv=None):
+    """Run many configuration files sharing meteo data."""
+    desc = "MEDEA batch: run many configuration files in one process."
+    parser = argparse.ArgumentParser(prog="medea batch", description=desc)
+    parser.add_argument(
+        "configs", nargs="+", help="Paths or glob patterns of configuration files."
+    )
+    parser.add_argument(
+        "-d", "--debug", help="Activate debug mode", action="store_true"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of scenarios run in parallel",
+    )
+    args = parser.parse_args(argv)
+
+    logger = setlogger(args.debug)
+
+    from .preflight import preflight
+
+    # expand patterns not expanded by the shell
+    paths = [Path(p) for arg in args.configs for p in (sorted(glob(arg)) or [arg])]
+    logger.info(f"Batch of {len(paths)} configuration files.")
+
+    statuses = {}
+    confs = {}
+    for path in paths:
+        try:
+            conf = readconf(path)
+            preflight(conf, loaddates)
+            if args.jobs > 1:
+                # parallelism is given by the scenarios
+                conf["workers"] = 1
+            confs[path] = conf
+        except Exception as e:
+            logger.error(f"Error reading {path}: {e}")
+            statuses[path] = {
+                "config": str(path),
+                "status": "failed",
+                "message": f"{e}",
+                "seconds": 0.0,
+            }
+
+    # read each meteo file once, before starting the workers
+    for path, conf in list(confs.items()):
+        if "chunkSize" in conf.keys():
+            # read by windows in each scenario
+            continue
+        try:
+            loadmet(conf)
+        except Exception as e:
+            logger.error(f"Error reading meteo file of {path}: {e}")
+            statuses[path] = {
+                "config": str(path),
+                "status": "failed",
+                "message": f"meteo file: {e}",
+                "seconds": 0.0,
+            }
+            del confs[path]
+    logger.info(f"{len(METS)} distinct meteorological files read.")
+
+    if args.jobs > 1 and len(confs) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            for path, status in zip(
+                confs, pool.map(runconfig, confs.keys(), confs.values())
+            ):
+                statuses[path] = status
+    else:
+        for path, conf in confs.items():
+            statuses[path] = runconfig(path, conf)
+
+    # summary of all scenarios, in the order of the command line
+    logger.info("Summary of the batch:")
+    logger.info(f"{'config':<40s} {'status':<7s} {'time (s)':>9s} message")
+    for path in paths:
+        status = statuses[path]
+        logger.info(
+            f"{str(path):<40s} {status['status']:<7s}"
+            f" {status['seconds']:9.3f} {status['message']}"
+        )
+    failed = sum(status["status"] != "ok" for status in statuses.values())
+    logger.info(f"{len(paths) - failed} scenarios completed, {failed} failed.")
+    logger.info("End of program.")
+    if failed:
+        sys.exit(1)
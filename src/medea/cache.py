@@ -0,0 +1,97 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from importlib.metadata import version
+from pathlib import Path
+
+import numpy as np
+
+from .sources import sourcekey
+
+# default maximum size of the factor cache (MB)
+CACHESIZE = 1024
+
+
+def filehash(path):
+    """Content hash of a file."""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class FactorCache:
+    """On-disk cache of the emission factors of single sources."""
+
+    def __init__(self, folder, methash, maxsize=CACHESIZE):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.methash = methash
+        self.maxsize = maxsize * 2**20
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, sou):
+        """Hash of meteo data and normalized parameters of a source."""
+        text = json.dumps(
+            {"medea": version("medea"), "met": self.methash, "source": sourcekey(sou)}
+        )
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def path(self, sou):
+        """Path of the cached factors of a source."""
+        return self.folder / f"{self.key(sou)}.npy"
+
+    def get(self, sou, shape):
+        """Cached factors of a source, or None if missing."""
+        logger = logging.getLogger()
+        path = self.path(sou)
+        try:
+            fac = np.load(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if fac.shape != shape:
+            logger.debug(f"Discarding cached factors {path.name}: bad shape.")
+            self.misses += 1
+            return None
+        # last use time drives eviction
+        os.utime(path)
+        self.hits += 1
+        return fac
+
+    def put(self, sou, fac):
+        """Store the factors of a source."""
+        path = self.path(sou)
+        # write to a temporary file first, so readers never see partial data
+        fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, np.ascontiguousarray(fac))
+        os.replace(tmp, path)
+
+    def evict(self):
+        """Remove least recently used factors above the maximum cache size."""
+        logger = logging.getLogger()
+        files = []
+        for path in self.folder.glob("*.npy"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.maxsize:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            logger.debug(f"Evicted cached factors {path.name}.")
@@ -0,0 +1,33 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import gzip
+from contextlib import nullcontext
+from pathlib import Path
+from typing import IO, cast
+
+# compression of text files, by extension (as inferred by pandas)
+COMPRESSION = {".gz": "gzip", ".zst": "zstd"}
+
+
+def openfile(path, mode="r", buffering=-1) -> IO[str]:
+    """Open a text file, compressed according to its extension."""
+    if hasattr(path, "read") or hasattr(path, "write"):
+        # file-like objects are left open for the caller
+        return cast(IO[str], nullcontext(path))
+    compression = COMPRESSION.get(Path(path).suffix.lower())
+    if compression == "gzip":
+        # level of the gzip command line tool, much faster than the maximum
+        return cast(IO[str], gzip.open(path, mode + "t", compresslevel=6))
+    if compression == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError(
+                f"Reading or writing {path} requires the zstandard package."
+            ) from None
+        return cast(IO[str], zstandard.open(path, mode + "t"))
+    return cast(IO[str], open(path, mode, buffering=buffering))
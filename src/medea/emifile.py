@@ -5,119 +5,153 @@
 #
 
 import logging
-import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from itertools import islice, repeat
 
+import numpy as np
 import pandas as pd
 
+from .compress import openfile
+from .factor import factorarrays
+from .met import metrow, metrows
+from .sources import factorspecies
+
+# number of lines and size of the buffer of streamed writes
+WRITECHUNK = 10000
+WRITEBUFFER = 1 << 20
+
+# projections with an additional line in the header of calpuff files
+PROJECTIONS = ["TTM", "LCC", "LAZA"]
+
 
 def pemtim(conf, met):
     """Modulate emission from existing pemtim."""
     logger = logging.getLogger()
     logger.debug("{}".format(pemtim.__doc__))
 
-    # opening pemspe and reading the number of species
+    # opening pemspe and reading the species
     logger.debug("Reading pemspe file.")
-    with open(conf["pemspe"], "r") as ps:
-        pemspe = [line.rstrip() for line in ps]
-
-    nspe = int(pemspe[1])
+    lspe = pemspecies(conf["pemspe"])
+    nspe = len(lspe)
     logger.debug(f"Number of species = {nspe}")
-
-    # checking the species in pemspe/pemtim
-    lspe = []
     for k in range(0, nspe):
-        lspe.append(str(pemspe[3 + k].split("*")[1].replace(" ", "")))
         logger.debug(f"Specie no. {k + 1} is {lspe[k]}.")
 
     # checking configuration file species
     for sou in conf["sources"]:
         for spe in sou["species"]:
             if spe not in lspe:
-                logger.info(f"{spe} in source = {sou['id']} in the")
-                logger.info("configuration file,")
-                logger.info("not present in pemtim/pemspe.")
-                logger.info("Exit: end procedure.")
-                sys.exit()
-    # collecting all sources involved in config.toml
-    lsou = []
-    for k in range(0, len(conf["sources"])):
-        lsou.append(conf["sources"][k]["id"])
+                raise ValueError(
+                    f"{spe} in source = {sou['id']} in the configuration file,"
+                    " not present in pemtim/pemspe."
+                )
+    # sources involved in config.toml and their factors
+    route = conf["routing"]["sources"]
+    factors = factorarrays(met, conf["routing"])
+    # meteo rows of periods, resolved once
+    metinds = {}
+
+    # streaming the input pemtim into the output pemtim
+    with (
+        openfile(conf["input"], "r") as file,
+        openfile(conf["output"], "w", buffering=WRITEBUFFER) as output,
+    ):
+        lines = (line.rstrip() for line in file)
+        # writing the pemtim header
+        logger.debug("Writing the pemtim header.")
+        header, refdate, nsou = pemtimheader(lines)
+        for line in header:
+            output.write(line + "\n")
+        logger.debug(f"Pemtim reference date is: {refdate}.")
+        logger.debug(f"Number of sources = {nsou}.")
+
+        buffer = []
+        nline = len(header)
+        logger.debug("Starting the loop on sources.")
+        for sou, period, head, species in pemtimperiods(lines, nsou, nspe):
+            for line in head:
+                buffer.append(line + "\n")
+            # read and process all species
+            for ispe, line in enumerate(species, start=1):
+                spe = str(line.split("#")[1]).replace(" ", "")
+                if sou in route and spe in route[sou]["species"]:
+                    if period == 0:
+                        logger.debug(f"Source {sou} has to be rescaled")
+                        logger.debug(f"on species {spe}.")
+                    factor = factors[route[sou]["species"][spe]]
+                    if isinstance(factor, np.ndarray):
+                        # factors varying in time
+                        if period not in metinds:
+                            date = refdate + timedelta(hours=period)
+                            metinds[period] = metrow(met, date)
+                        factor = factor[metinds[period]]
+                    scheme = route[sou]["scheme"]
+                    if scheme == 1:
+                        oldmass = float(line.split("#")[2])
+                        newmass = oldmass * factor
+                    if (scheme == 2) | (scheme == 3):
+                        newmass = 1.0 * factor
+                    dummy = int(line.split("#")[3])
+                    s2w = "{:3d}#{:<8s}#{:6.3E}#{:4d}#\n"
+                    buffer.append(s2w.format(ispe, spe, float(newmass), dummy))
+                else:
+                    buffer.append(line + "\n")
+            if len(buffer) >= WRITECHUNK:
+                output.write("".join(buffer))
+                nline += len(buffer)
+                buffer.clear()
+        output.write("".join(buffer))
+        nline += len(buffer)
+    logger.debug("Output pemtim file written.")
+    return nline
 
-    # opening the input pemtim
-    with open(conf["input"], "r") as file:
-        lines = [line.rstrip() for line in file]
-    # opening the output pemtim for writing
-    output = open(conf["output"], "w")
-    # writing the pemtim header
-    logger.debug("Writing the pemtim header.")
-    for i in range(0, 6):
-        output.write(lines[i] + "\n")
-    # building the reference date
-    pdate = [int(s) for s in lines[5].split() if s.isdigit()]
+
+def pemspecies(path):
+    """Species of a pemspe file."""
+    with openfile(path, "r") as ps:
+        pemspe = [line.rstrip() for line in ps]
+    nspe = int(pemspe[1])
+    return [pemspe[3 + k].split("*")[1].replace(" ", "") for k in range(0, nspe)]
+
+
+def pemtimheader(lines):
+    """Header lines, reference date and number of sources of a pemtim file."""
+    header = [next(lines) for i in range(0, 6)]
+    pdate = [int(s) for s in header[5].split() if s.isdigit()]
     refdate = datetime(
         2000 + pdate[2], pdate[1], pdate[0], pdate[3], pdate[4], pdate[5]
     )
-    logger.debug(f"Pemtim reference date is: {refdate}.")
+    nsou = int(header[1].split()[0])
+    return header, refdate, nsou
 
-    # reading the number of sources
-    nsou = int(lines[1].split()[0])
-    logger.debug(f"Number of sources = {nsou}.")
 
-    ind = 6
-    logger.debug("Starting the loop on sources.")
+def pemtimperiods(lines, nsou, nspe):
+    """Source, hours from the reference date and lines of each pemtim period."""
     for isou in range(1, nsou + 1):
-        sou = int(lines[ind].split("#")[0])
-        output.write(lines[ind] + "\n")
-        ind += 1
-        nper = int(lines[ind].split("#")[0])
-        output.write(lines[ind] + "\n")
-        ind += 1
-        date = refdate
-
+        # source id and number of periods
+        head = [next(lines), next(lines)]
+        sou = int(head[0].split("#")[0])
+        nper = int(head[1].split("#")[0])
+        # hours elapsed from the reference date
+        hours = 0
         for iper in range(1, nper + 1):
-            dl = lines[ind].split("#")
-            hms = [int(s) for s in dl[2:5]]
-            output.write(lines[ind] + "\n")
-            metind = met.index[met["date"] == date.strftime("%Y-%m-%dT%H:%M:%SZ")]
-            date = date + timedelta(hours=hms[0])
-            ind += 1
+            line = next(lines)
+            hms = [int(s) for s in line.split("#")[2:5]]
+            period = hours
+            hours += hms[0]
             if iper == 1:
-                its = int(lines[ind].split("#")[5])
+                head.append(line)
+                # source geometry, on two lines for its == 2
+                line = next(lines)
+                its = int(line.split("#")[5])
+                head.append(line)
+                head.append(next(lines))
                 if its == 2:
-                    for j in range(0, 3):
-                        output.write(lines[ind + j] + "\n")
-                    ind += 3
-                else:
-                    for j in range(0, 2):
-                        output.write(lines[ind + j] + "\n")
-                    ind += 2
-            # read and process all species
-            for ispe in range(1, nspe + 1):
-                spe = str(lines[ind].split("#")[1]).replace(" ", "")
-                if sou in lsou:
-                    iconfsou = lsou.index(sou)
-                    scheme = conf["sources"][iconfsou]["scheme"]
-                if sou in lsou and spe in conf["sources"][iconfsou]["species"]:
-                    if iper == 1:
-                        logger.debug(f"Source {sou} has to be rescaled")
-                        logger.debug(f"on species {spe}.")
-                    factor = met.iloc[metind][str(sou) + "_" + spe]
-                    if scheme == 1:
-                        oldmass = float(lines[ind].split("#")[2])
-                        newmass = oldmass * factor._values
-                    if (scheme == 2) | (scheme == 3):
-                        newmass = 1.0 * factor._values
-                    dummy = int(lines[ind].split("#")[3])
-                    s2w = "{:3d}#{:<8s}#{:6.3E}#{:4d}#\n"
-                    output.write(s2w.format(ispe, spe, float(newmass[0]), dummy))
-                else:
-                    output.write(lines[ind] + "\n")
-                ind += 1
-    file.close()
-    output.close()
-    logger.debug("Output pemtim file written.")
-    return
+                    head.append(next(lines))
+            else:
+                head = [line]
+            yield sou, period, head, list(islice(lines, nspe))
 
 
 def calpuff(conf, met):
@@ -126,64 +160,146 @@ def calpuff(conf, met):
     logger.debug("{}".format(calpuff.__doc__))
 
     # opening the input calpuff emissions input
-    with open(conf["input"], "r") as file:
+    with openfile(conf["input"], "r") as file:
         lines = [line.rstrip() for line in file]
-    # opening the output file for writing
-    output = open(conf["output"], "w")
 
     # collecting all sources involved in config.toml
-    lsou = []
-    for k in range(0, len(conf["sources"])):
-        lsou.append(conf["sources"][k]["id"])
+    route = conf["routing"]["sources"]
+    confsou = {sou: entry["scheme"] for sou, entry in route.items()}
 
     # read source and species information
-    ncomm = int(lines[1])
-    proj = str(lines[ncomm].split(" ")[0])
-    if proj in ["TTM", "LCC", "LAZA"]:
+    head, nsou, nspe, lspe = calpuffheader(iter(lines))
+    # first source of the time-variant part of the file
+    start = len(head) - 1
+
+    # factors of configured sources at the deadline of each time block
+    logger.debug("Reading the deadlines of the time-variant part of file.")
+    dates = [calpuffdate(line) for line in lines[start - 1 :: nsou + 1]]
+    metind = metrows(met, pd.DatetimeIndex(dates))
+    colindex = {}
+    blocks = {}
+    columns = []
+    for sou, entry in route.items():
+        if all(spe in entry["species"] for spe in lspe[0:nspe]):
+            # sources with the same parameters share the same columns
+            pos = tuple(entry["species"][spe] for spe in lspe[0:nspe])
+            if pos not in blocks:
+                blocks[pos] = len(columns)
+                columns += pos
+            colindex[sou] = blocks[pos]
+    # only the rows of the time blocks are copied
+    arrays = factorarrays(met, conf["routing"])
+    factors = np.empty((len(metind), len(columns)))
+    for i, pos in enumerate(columns):
+        factor = arrays[pos]
+        factors[:, i] = factor[metind] if isinstance(factor, np.ndarray) else factor
+
+    # opening the output file for writing
+    with openfile(conf["output"], "w", buffering=WRITEBUFFER) as output:
+        # write the header information
+        logger.debug("Writing the header part of file.")
+        for i in range(0, start - 1):
+            output.write(lines[i] + "\n")
+        logger.debug("Writing the time-variant part of file.")
+        workers = int(conf["workers"]) if "workers" in conf.keys() else 1
+        if workers > 1:
+            # split the time blocks in chunks processed in parallel
+            nblock = len(dates)
+            size = max(1, -(-nblock // (4 * workers)))
+            logger.debug(f"Rewriting {nblock} time blocks with {workers} workers.")
+            chunks = range(0, nblock, size)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for text in pool.map(
+                    calpuffblocks,
+                    [
+                        lines[
+                            start
+                            - 1
+                            + k * (nsou + 1) : start
+                            - 1
+                            + (k + size) * (nsou + 1)
+                        ]
+                        for k in chunks
+                    ],
+                    [factors[k : k + size] for k in chunks],
+                    repeat(nsou),
+                    repeat(nspe),
+                    repeat(confsou),
+                    repeat(colindex),
+                ):
+                    output.write(text)
+        else:
+            output.write(
+                calpuffblocks(
+                    lines[start - 1 :], factors, nsou, nspe, confsou, colindex
+                )
+            )
+    logger.debug("Output calpuff file written.")
+    return len(lines)
+
+
+def calpuffheader(lines):
+    """Lines up to the first time block, sources and species of calpuff files."""
+    head = [next(lines), next(lines)]
+    ncomm = int(head[1])
+    head += [next(lines) for i in range(len(head), ncomm + 1)]
+    proj = str(head[ncomm].split(" ")[0])
+    if proj in PROJECTIONS:
         ncomm = ncomm + 1
-    nsou = int(lines[ncomm + 8].split(" ")[0])
-    nspe = int(lines[ncomm + 8].split(" ")[1])
-    lspe = [s.replace("'", "") for s in lines[ncomm + 9].split(" ")]
+    head += [next(lines) for i in range(len(head), ncomm + 10)]
+    nsou = int(head[ncomm + 8].split(" ")[0])
+    nspe = int(head[ncomm + 8].split(" ")[1])
+    lspe = [s.replace("'", "") for s in head[ncomm + 9].split(" ")]
 
-    # search the time-variant part of the file
+    # the header ends before the first source of the first time block
     flag = 0
-    for i in range(ncomm + 10, len(lines)):
-        if lines[i][0] == "'":
+    while flag < nsou + 1:
+        head.append(next(lines))
+        if head[-1][0] == "'":
             flag += 1
-        if flag == (nsou + 1):
-            start = i
-            break
-    # write the header information
-    logger.debug("Writing the header part of file.")
-    for i in range(0, start - 1):
-        output.write(lines[i] + "\n")
-    logger.debug("Writing the time-variant part of file.")
-    for ind in range(start - 1, len(lines), nsou + 1):
-        pdate = [int(s) for s in lines[ind].split() if s.isdigit()]
-        date = datetime(pdate[0], 1, 1, pdate[2], 0, pdate[3]) + timedelta(
-            days=(pdate[1] - 1)
-        )
-        metind = met.index[met["date"] == date.strftime("%Y-%m-%dT%H:%M:%SZ")]
-        output.write(lines[ind] + "\n")
+    return head, nsou, nspe, lspe
+
+
+def calpuffdate(line):
+    """Deadline of a time block of a calpuff emissions input."""
+    pdate = [int(s) for s in line.split() if s.isdigit()]
+    return datetime(pdate[0], 1, 1, pdate[2], 0, pdate[3]) + timedelta(
+        days=(pdate[1] - 1)
+    )
+
+
+def calpuffname(line):
+    """Name of the source of a line of a calpuff time block."""
+    return str(line[0:15].split("'")[1])
+
+
+def calpuffblocks(lines, factors, nsou, nspe, confsou, colindex):
+    """Rewrite consecutive time blocks of a calpuff emissions input."""
+    output = []
+    for iblock, ind in enumerate(range(0, len(lines), nsou + 1)):
+        output.append(lines[ind] + "\n")
         for sou in range(0, nsou):
             ind = ind + 1
-            namesou = str(lines[ind][0:15].split("'")[1])
+            namesou = calpuffname(lines[ind])
             line = lines[ind][16:].split(" ")
-            if namesou in lsou:
+            if namesou in confsou:
+                if namesou not in colindex:
+                    raise ValueError(
+                        f"Missing emission factors for some species of {namesou}."
+                    )
                 newspe = []
-                iconfsou = lsou.index(namesou)
-                scheme = conf["sources"][iconfsou]["scheme"]
+                scheme = confsou[namesou]
                 for s in range(0, nspe):
-                    factor = met.iloc[metind][namesou + "_" + lspe[s]]
+                    factor = factors[iblock, colindex[namesou] + s]
                     if scheme == 1:
                         oldmass = float(line[5 + s])
-                        newmass = oldmass * factor._values
+                        newmass = oldmass * factor
                     if (scheme == 2) | (scheme == 3):
-                        newmass = factor._values
+                        newmass = factor
                     newspe.append(newmass)
                 # write the source information
                 fstr = "{:<15s} {:3.2f} {:1.2f} {:1.1f} {:1.1f}"
-                output.write(
+                output.append(
                     fstr.format(
                         lines[ind][0:15],
                         float(line[-nspe - 4]),
@@ -194,16 +310,12 @@ def calpuff(conf, met):
                 )
                 # for each species write the modified emission
                 for i in range(0, nspe):
-                    output.write(" {:1.7E}".format(float(newspe[i])))
-                output.write("\n")
+                    output.append(" {:1.7E}".format(float(newspe[i])))
+                output.append("\n")
             else:
                 # otherwise write the line without modifications
-                output.write(lines[ind] + "\n")
-    # closing input and output files
-    output.close()
-    file.close()
-    logger.debug("Output calpuff file written.")
-    return
+                output.append(lines[ind] + "\n")
+    return "".join(output)
 
 
 def impact(conf, met):
@@ -212,61 +324,63 @@ def impact(conf, met):
     logger.debug("{}".format(impact.__doc__))
 
     # opening the input impact emissions input
-    file = pd.DataFrame(pd.read_csv(conf["input"], sep=";"))
+    if isinstance(conf["input"], pd.DataFrame):
+        file = conf["input"].copy()
+    else:
+        file = pd.DataFrame(pd.read_csv(conf["input"], sep=";"))
 
-    # Create output emissions data structure
-    lsout = []
+    file = impactframe(file, conf["sources"], met, conf["routing"])
+
+    # writing output csv file
+    file.to_csv(conf["output"], index=False, sep=";")
+    return len(file)
 
-    # collecting all sources involved in config.toml
-    lsou = []
-    for k in range(0, len(conf["sources"])):
-        lsou.append(conf["sources"][k]["id"])
+
+def impactframe(file, sources, met, route):
+    """Rescale the lines of Impact emissions in a data frame."""
+    logger = logging.getLogger()
 
     # configuration file species
     cspe = []
-    for sou in conf["sources"]:
+    for sou in sources:
         for spe in sou["species"]:
             cspe.append(spe)
 
     # Check if all required species are present in the original emission file
     for spe in cspe:
         qspe = "Q_" + spe
-        try:
-            file.iloc[1][qspe]
-        except KeyError as e:
-            logger.error(f"{e} is missing in the original emission file.")
-            logger.error("Please provide emissions for all required species.")
-            sys.exit()
-
-    # reading each lines of input
-    for index, row in file.iterrows():
-        date = datetime.strptime(row["DATEDEB"], "%d-%m-%Y %H:%M:%S")
-        date_str = date.strftime("%Y-%m-%dT%H:%M:%SZ")
-        metind = met.index[met["date"] == date_str]
-        sou = row["SRCEID"]
-        if sou in lsou:
-            iconfsou = lsou.index(sou)
-            scheme = conf["sources"][iconfsou]["scheme"]
-            for spe in cspe:
-                factor = met.iloc[metind][str(sou) + "_" + spe]
-                qspe = "Q_" + spe
-                try:
-                    oldmass = float(row[qspe])
-                except KeyError as e:
-                    logger.error(f"{e}")
-                    sys.exit()
-
-                if scheme == 1:
-                    newmass = oldmass * factor._values
-                if (scheme == 2) | (scheme == 3):
-                    newmass = factor._values
-                row[qspe] = newmass
-        lsout.append(row)
-
-    output = pd.DataFrame(lsout)
-    # writing output csv file
-    output.to_csv(conf["output"], index=False, sep=";")
-    return
+        if qspe not in file.columns:
+            raise ValueError(f"'{qspe}' is missing in the original emission file.")
+
+    # parsing the deadlines of all lines at once
+    dates = pd.to_datetime(file["DATEDEB"], format="%d-%m-%Y %H:%M:%S")
+
+    # rescaling the lines of each source in bulk
+    factors = factorarrays(met, route)
+    for sou, entry in route["sources"].items():
+        rows = (file["SRCEID"] == sou).to_numpy()
+        if not rows.any():
+            continue
+        logger.debug(f"Source {sou} has to be rescaled.")
+        metind = None
+        for spe in factorspecies(entry["source"]):
+            qspe = "Q_" + spe
+            factor = factors[entry["species"][spe]]
+            if isinstance(factor, np.ndarray):
+                # factors varying in time
+                if metind is None:
+                    metind = metrows(met, dates[rows])
+                factor = factor[metind]
+            if entry["scheme"] == 1:
+                newmass = file.loc[rows, qspe].to_numpy(dtype=float) * factor
+            if (entry["scheme"] == 2) | (entry["scheme"] == 3):
+                newmass = factor
+            if file[qspe].dtype.kind in "iu":
+                # lines left untouched keep their integer values
+                file[qspe] = file[qspe].astype(object)
+            file.loc[rows, qspe] = newmass
+
+    return file
 
 
 def aermod(conf, met):
@@ -274,72 +388,76 @@ def aermod(conf, met):
     logger = logging.getLogger()
     logger.debug("{}".format(aermod.__doc__))
 
-    # opening the input aermod emissions input
-    with open(conf["input"], "r") as file:
-        lines = [line.rstrip() for line in file]
-    # opening the output file for writing
-    output = open(conf["output"], "w")
-
-    # collecting all sources involved in config.toml
-    lsou = []
-    for k in range(0, len(conf["sources"])):
-        lsou.append(conf["sources"][k]["id"])
+    # configuration and factors of the sources involved in config.toml
+    route = conf["routing"]["sources"]
+    factors = factorarrays(met, conf["routing"])
 
     s2w = "{:2s} {:8s} {:2d} {:>2d} {:>2d} {:>2d} {:<7s} "
-    ns = len(lines[0].split()) - 7
-    # processing each line of the emission file
-    for ind in range(0, len(lines)):
-        line = lines[ind].split()
-        sou = str(line[6])
-        # if the source has to be processed
-        if sou in lsou:
-            # build datetime from emission file line
-            date = datetime(
-                year=2000 + int(line[2]),
-                month=int(line[3]),
-                day=int(line[4]),
-                hour=(int(line[5]) - 1),
-                minute=0,
-                second=0,
-            )
-            date = date + timedelta(hours=1)
-            # find the corresponding emission factor
-            metind = met.index[met["date"] == date.strftime("%Y-%m-%dT%H:%M:%SZ")]
-            iconfsou = lsou.index(sou)
-            scheme = conf["sources"][iconfsou]["scheme"]
-            spe = conf["sources"][iconfsou]["species"][0]
-            factor = met.iloc[metind][str(sou) + "_" + spe]
-            if scheme == 1:
-                oldmass = float(line[7])
-                newmass = oldmass * factor._values
-            if (scheme == 2) | (scheme == 3):
-                newmass = factor._values
-            newline = line
-            newline[7] = newmass.item(0)
-        else:
-            # in this case the line does not change
-            newline = line
-        # writing the new line or simply copy the
-        # existing one
-        output.write(
-            s2w.format(
-                newline[0],
-                newline[1],
-                int(newline[2]),
-                int(newline[3]),
-                int(newline[4]),
-                int(newline[5]),
-                newline[6],
+    ns = None
+    lastdate = None
+    buffer = []
+    nline = 0
+    # streaming the emission file line by line
+    with (
+        openfile(conf["input"], "r") as file,
+        openfile(conf["output"], "w", buffering=WRITEBUFFER) as output,
+    ):
+        for line in (row.split() for row in file):
+            if not line:
+                continue
+            if ns is None:
+                ns = len(line) - 7
+            sou = str(line[6])
+            rate = float(line[7])
+            # if the source has to be processed
+            if sou in route:
+                scheme = route[sou]["scheme"]
+                spe = route[sou]["source"]["species"][0]
+                factor = factors[route[sou]["species"][spe]]
+                if isinstance(factor, np.ndarray):
+                    # find the meteo row once for all sources of a deadline
+                    if line[2:6] != lastdate:
+                        metind = metrow(met, aermoddate(*line[2:6]))
+                        lastdate = line[2:6]
+                    factor = factor[metind]
+                if scheme == 1:
+                    rate = rate * factor
+                if (scheme == 2) | (scheme == 3):
+                    rate = factor
+            # formatting the new line or simply the existing one
+            newline = s2w.format(
+                line[0],
+                line[1],
+                int(line[2]),
+                int(line[3]),
+                int(line[4]),
+                int(line[5]),
+                line[6],
             )
-        )
-        output.write("{:>6.3f} ".format(newline[7]))
-        # formatting the elements after the emission rate
-        for i in range(1, ns):
-            output.write("{:>6.3f} ".format(float(newline[7 + i])))
-        # windows end-of-line \r\n, for linux/mac set \n
-        output.write("\r\n")
-    # closing input and output files
-    output.close()
-    file.close()
-    logger.debug("Output calpuff file written.")
-    return
+            newline += "{:>6.3f} ".format(rate)
+            # formatting the elements after the emission rate
+            for i in range(1, ns):
+                newline += "{:>6.3f} ".format(float(line[7 + i]))
+            # windows end-of-line \r\n, for linux/mac set \n
+            buffer.append(newline + "\r\n")
+            if len(buffer) == WRITECHUNK:
+                output.write("".join(buffer))
+                nline += len(buffer)
+                buffer.clear()
+        output.write("".join(buffer))
+        nline += len(buffer)
+    logger.debug("Output aermod file written.")
+    return nline
+
+
+def aermoddate(year, month, day, hour):
+    """Deadline of a line of an aermod emissions input."""
+    date = datetime(
+        year=2000 + int(year),
+        month=int(month),
+        day=int(day),
+        hour=(int(hour) - 1),
+        minute=0,
+        second=0,
+    )
+    return date + timedelta(hours=1)
@@ -6,83 +6,134 @@
 
 import logging
 import math
-import sys
 
 import numpy as np
 import pandas as pd
 
-
-def odour(met, conf, ind):
+from .profiling import Profile
+from .sources import (
+    DUST,
+    INVARIANT,
+    TERRAINS,
+    colnames,
+    sharedcolumns,
+    uniquesources,
+)
+
+# exponent and default reference velocity (m/s) of the odour scheme
+GAMMA = 0.5
+VREF = 0.3
+
+# beta of the odour scheme by stability class (rows) and terrain (columns)
+STABCLASSES = ["A", "B", "C", "D", "E", "F"]
+BETA = np.array(
+    [
+        [0.07, 0.15],
+        [0.07, 0.15],
+        [0.1, 0.2],
+        [0.15, 0.25],
+        [0.35, 0.3],
+        [0.55, 0.3],
+    ]
+)
+BETA_DEFAULT = 0.55
+
+# elements of the (hours x sources) arrays of scheme 2 computed at once
+BLOCKSIZE = 1 << 20
+
+
+def odour(met, sources):
     """Odour scheme for rescaling emissions."""
     logger = logging.getLogger()
     logger.debug("{}".format(odour.__doc__))
 
-    gamma = 0.5
-    dt = {
-        "rural": [0.07, 0.07, 0.1, 0.15, 0.35, 0.55],
-        "urban": [0.15, 0.15, 0.2, 0.25, 0.3, 0.3],
-    }
-
-    tab = pd.DataFrame(data=dt, index=["A", "B", "C", "D", "E", "F"])
-    if "vref" in conf["sources"][ind].keys():
-        vref = conf["sources"][ind]["vref"]
-        logger.debug("Reference velocity available from the")
-        logger.debug("configuration toml file.")
-    else:
-        vref = 0.3
-        logger.debug("Reference velocity not available from the")
-        logger.debug(f"configuration toml file: {vref} default value.")
-    rat = conf["sources"][ind]["height"] / met["z"]
-    if "terrain" in conf["sources"][ind].keys() and "stabclass" in met.keys():
+    # a factor is computed for the first species only
+    for sou in sources:
+        if len(sou["species"]) != 1:
+            raise ValueError(
+                f"Invalid species {sou['species']} in source {sou['id']}:"
+                " a single species is required."
+            )
+
+    # parameters of each source, as rows of the (hours x sources) grid
+    height = np.array([sou["height"] for sou in sources], dtype=np.float64)
+    vref = np.array([sou.get("vref", VREF) for sou in sources], dtype=np.float64)
+    logger.debug(f"Default reference velocity {VREF} for missing vref.")
+
+    # beta of each hour and source, default when terrain or class are missing
+    beta = np.full((len(met), len(sources)), BETA_DEFAULT)
+    terrain = [isou for isou, sou in enumerate(sources) if "terrain" in sou.keys()]
+    if terrain and "stabclass" in met.keys():
         logger.debug("Terrain type and stability class information")
         logger.debug("are available: computing beta.")
-        beta = pd.DataFrame(
-            columns=["val"],
-            data=tab[conf["sources"][ind]["terrain"]][met["stabclass"]].to_list(),
-            index=met.index.values.tolist(),
-        )
-        tmp = (met["ws"] * (rat.pow(beta["val"])) / vref) ** gamma
+        codes = stabcodes(met["stabclass"])
+        for isou in terrain:
+            if sources[isou]["terrain"] not in TERRAINS:
+                raise ValueError(
+                    f"Invalid terrain \"{sources[isou]['terrain']}\" for source"
+                    f" {sources[isou]['id']}. Allowed terrains are {TERRAINS}"
+                )
+        cols = [TERRAINS.index(sources[isou]["terrain"]) for isou in terrain]
+        beta[:, terrain] = BETA[codes[:, None], cols]
     else:
-        beta = 0.55  # default value
         logger.debug("Terrain type or stability class information")
-        logger.debug(f"are missing: default beta value = {beta}.")
-        tmp = (met["ws"] * (rat.pow(beta)) / vref) ** gamma
-
-    colname = str(conf["sources"][ind]["id"]) + "_" + conf["sources"][ind]["species"][0]
-    met.insert(len(met.columns), colname, round(tmp, 2))
-    return met
+        logger.debug(f"are missing: default beta value = {BETA_DEFAULT}.")
+
+    # all sources at once: (ws * (height / z)**beta / vref)**gamma
+    fac = np.power(height / met["z"].to_numpy()[:, None], beta, out=beta)
+    fac *= met["ws"].to_numpy()[:, None]
+    fac /= vref
+    np.power(fac, GAMMA, out=fac)
+    return fac[:, :, None]
+
+
+def stabcodes(stabclass):
+    """Row positions of stability classes in the beta table."""
+    codes = pd.Categorical(stabclass, categories=STABCLASSES).codes
+    if (codes < 0).any():
+        bad = np.asarray(stabclass)[codes < 0][0]
+        raise ValueError(
+            f"Invalid stability class {bad}. Allowed classes are {STABCLASSES}"
+        )
+    return codes
 
 
 def sympar(sym, alpha):
+    """Percentages of pile surface in each EPA sub-area."""
     if sym:
-        ppsa = np.array([[40.0, 48.0, 12.0, 0.0]])
-    if not sym:
-        ppsa = np.empty((len(alpha), 4), dtype=float)
-        for ind in range(0, len(alpha)):
-            val = alpha[ind]
-            if (val >= 0.0) and (val <= 20.0):
-                ppsa[ind, :] = np.array([36.0, 50.0, 14.0, 0.0])
-            if (val > 20.0) and (val <= 40.0):
-                ppsa[ind, :] = np.array([31.0, 51.0, 15.0, 3.0])
-            if (val > 40.0) and (val <= 90.0):
-                ppsa[ind, :] = np.array([28.0, 54.0, 14.0, 4.0])
-    return ppsa
-
-
-def inc2alpha(input):
-    if input > 360.0:
-        input = input - 360.0
-    if input < 0.0:
-        input = input + 360.0
-    if input >= 270.0:
-        alpha = input - 270.0
-    if (input < 270.0) and (input > 180):
-        alpha = 270 - input
-    if (input <= 180.0) and (input > 90):
-        alpha = input - 90.0
-    if input <= 90.0:
-        alpha = 90.0 - input
-    return alpha
+        return np.array([[40.0, 48.0, 12.0, 0.0]])
+    # EPA classes of the wind angle: [0, 20], (20, 40], (40, 90]
+    ppsa = np.array(
+        [
+            [36.0, 50.0, 14.0, 0.0],
+            [31.0, 51.0, 15.0, 3.0],
+            [28.0, 54.0, 14.0, 4.0],
+            [np.nan, np.nan, np.nan, np.nan],
+        ]
+    )
+    alpha = np.asarray(alpha, dtype=float)
+    iclass = np.select(
+        [
+            (alpha >= 0.0) & (alpha <= 20.0),
+            (alpha > 20.0) & (alpha <= 40.0),
+            (alpha > 40.0) & (alpha <= 90.0),
+        ],
+        [0, 1, 2],
+        default=3,
+    )
+    return ppsa[iclass]
+
+
+def inc2alpha(inc):
+    """Angle between wind direction and pile orientation."""
+    inc = np.asarray(inc, dtype=float)
+    inc = np.where(inc > 360.0, inc - 360.0, inc)
+    inc = np.where(inc < 0.0, inc + 360.0, inc)
+    return np.select(
+        [inc >= 270.0, inc > 180.0, inc > 90.0, inc <= 90.0],
+        [inc - 270.0, 270.0 - inc, inc - 90.0, 90.0 - inc],
+        default=np.nan,
+    )
 
 
 def asymsurface(major, minor, height):
@@ -91,10 +142,10 @@ def asymsurface(major, minor, height):
     logger.debug("{}".format(asymsurface.__doc__))
 
     if height >= (minor / 2):
-        logger.error("Invalid geometrical values of the pile")
-        logger.error(f"({height} >= {minor / 2}) causes")
-        logger.error("lateral slope over 45°: exit.")
-        sys.exit()
+        raise ValueError(
+            f"Invalid geometrical values of the pile ({height} >= {minor / 2})"
+            " causes lateral slope over 45°."
+        )
     top = minor / 2 - height
     slope = 180.0 * math.atan(height / ((minor - top) / 2)) / math.pi
     logger.info(f"Trapezoidal top side is {round(top, 1)} meters and")
@@ -104,76 +155,91 @@ def asymsurface(major, minor, height):
     return s
 
 
-def scheme2(met, conf, ind):
+def scheme2(met, sources):
     """Cumulus scheme to set emissions."""
     logger = logging.getLogger()
     logger.debug("{}".format(scheme2.__doc__))
-    sou = conf["sources"][ind]
-    if set(sou["species"]) != set(["PM25", "PM10", "PTS"]):
-        logger.error(f"Invalid species {sou['species']} in source {sou['id']}")
-        logger.error("PM25, PM10 and PTS are all required: exit")
-        sys.exit()
-
-    listasym = ["major", "minor", "angle", "height"]
-    asymmetric = all(item in sou.keys() for item in listasym)
-    listcon = ["radius", "height"]
-    conical = all(item in sou.keys() for item in listcon)
-
-    if (asymmetric + conical) != 1:
-        logger.info(f"Undefined shape of source {sou['id']}: exit.")
-        sys.exit()
-
-    if asymmetric:
-        logger.debug(f"Source {sou['id']} has asymmetric shape.")
-        major = sou["major"]
-        minor = sou["minor"]
-        if abs(sou["angle"]) > 90.0:
-            logger.info(f"Bad definition of angle {sou['angle']}: exit.")
-            sys.exit()
-        if major <= minor:
-            logger.info("Bad definition of geometry (major < minor),")
-            logger.info(f"{major} < {minor}: exit.")
-            sys.exit()
-        # ap1 = math.sqrt((major / 5)**2 + sou['height']**2)
-        # ap2 = math.sqrt((minor / 3)**2 + sou['height']**2)
-        # s = 8 * major * ap2 / 5 + 4 * minor * ap1 / 3
-        s = asymsurface(major, minor, sou["height"])
-        base = minor
-        # computing angle to select EPA case
-        if sou["angle"] < 0.0:
-            ainc = met["wd"] - (-90.0 - sou["angle"])
-        else:
-            ainc = met["wd"] - (90.0 - sou["angle"])
 
-        alpha = ainc.apply(inc2alpha)
-        ppsa = sympar(False, alpha.to_numpy())
-    elif conical:
-        r = sou["radius"]
+    # parameter for PM25, PM10, PTS
+    k = np.array([0.075, 0.5, 1.0])
+
+    fac = np.empty((len(met), len(sources), len(DUST)))
+    # blocks of sources bound the memory of the (hours x sources) arrays
+    step = max(1, BLOCKSIZE // max(1, len(met)))
+    for start in range(0, len(sources), step):
+        block = slice(start, start + step)
+        fac[:, block, :] = erosion(met, sources[block])[:, :, np.newaxis] * k
+    return fac
+
+
+def erosion(met, sources):
+    """Hourly emitted mass (mcg) by wind erosion of piles."""
+    logger = logging.getLogger()
+
+    # geometry and parameters of each pile
+    offset = np.full(len(sources), np.nan)
+    surface = np.empty(len(sources))
+    psba = np.empty((len(sources), 4))
+    z0 = np.empty(len(sources))
+    tfv = np.empty(len(sources))
+    for isou, sou in enumerate(sources):
+        if set(sou["species"]) != set(DUST):
+            raise ValueError(
+                f"Invalid species {sou['species']} in source {sou['id']}:"
+                " PM25, PM10 and PTS are all required."
+            )
+
+        listasym = ["major", "minor", "angle", "height"]
+        asymmetric = all(item in sou.keys() for item in listasym)
+        listcon = ["radius", "height"]
+        conical = all(item in sou.keys() for item in listcon)
+
+        if (asymmetric + conical) != 1:
+            raise ValueError(f"Undefined shape of source {sou['id']}.")
+
         h = sou["height"]
-        s = math.pi * r * math.sqrt(r**2 + h**2)
-        base = 2 * r
-        ppsa = sympar(True, 1.0)
-        ppsa = np.repeat(a=ppsa, repeats = len(met["ws"]), axis=0)
-        logger.debug(f"Source {sou['id']} has conical shape.")
-        logger.debug(f"Length of ws = {len(met['ws'])}")
-        logger.debug(f"Shape of ppsa = {np.shape(ppsa)}")
-    else:
-        logger.info(f"Undefined shape of source {sou['id']}: exit.")
-        sys.exit()
+        if asymmetric:
+            logger.debug(f"Source {sou['id']} has asymmetric shape.")
+            major = sou["major"]
+            minor = sou["minor"]
+            if abs(sou["angle"]) > 90.0:
+                raise ValueError(f"Bad definition of angle {sou['angle']}.")
+            if major <= minor:
+                raise ValueError(
+                    f"Bad definition of geometry (major < minor), {major} < {minor}."
+                )
+            # ap1 = math.sqrt((major / 5)**2 + sou['height']**2)
+            # ap2 = math.sqrt((minor / 3)**2 + sou['height']**2)
+            # s = 8 * major * ap2 / 5 + 4 * minor * ap1 / 3
+            surface[isou] = asymsurface(major, minor, h)
+            base = minor
+            # angle to select EPA case, from the wind direction
+            if sou["angle"] < 0.0:
+                offset[isou] = -90.0 - sou["angle"]
+            else:
+                offset[isou] = 90.0 - sou["angle"]
+        else:
+            r = sou["radius"]
+            surface[isou] = math.pi * r * math.sqrt(r**2 + h**2)
+            base = 2 * r
+            logger.debug(f"Source {sou['id']} has conical shape.")
 
-    if h / base <= 0.2:
-        psba = [1, 1, 1, 1]
-    else:
-        psba = [0.2, 0.6, 0.9, 1.1]
+        if h / base <= 0.2:
+            psba[isou] = [1, 1, 1, 1]
+        else:
+            psba[isou] = [0.2, 0.6, 0.9, 1.1]
 
-    # Convert roughness from cm to meters
-    if "roughness" in sou.keys():
-        z0 = sou["roughness"] / 100.0
-    else:
-        z0 = 0.005
+        # Convert roughness from cm to meters
+        if "roughness" in sou.keys():
+            z0[isou] = sou["roughness"] / 100.0
+        else:
+            z0[isou] = 0.005
+        tfv[isou] = sou["tfv"]
 
     # scale wind speed to 10 m height
-    ws10 = met["ws"] * (np.log(10.0 / z0)) / (np.log(met["z"] / z0))
+    ws = met["ws"].to_numpy()[:, np.newaxis]
+    z = met["z"].to_numpy()[:, np.newaxis]
+    ws10 = ws * (np.log(10.0 / z0)) / (np.log(z / z0))
 
     # from wind speed to fastest mile
     a = 1.6
@@ -181,79 +247,175 @@ def scheme2(met, conf, ind):
     fm = a * ws10 + b
 
     # computing friction velocity
-    ust = np.empty((len(fm), len(psba)))
-    for idx, psbai in enumerate(psba):
-        ust[:, idx] = 0.4 * fm / np.log(0.25 / z0) * psbai
-    tfv = sou["tfv"] * np.ones((len(fm), len(psba)))
+    ust = 0.4 * fm[:, :, np.newaxis] / np.log(0.25 / z0)[:, np.newaxis] * psba
+    tfv = tfv[:, np.newaxis]
     ust = np.where(ust > tfv, ust, tfv)
 
     # erosion potential
-    p = np.zeros_like(ust)
     p = 58 * (ust - tfv) ** 2 + 25 * (ust - tfv)
 
-    # parameter for PTS, PM25, PM10
-    k25 = 0.075
-    k10 = 0.5
-    kpts = 1.0
+    # percentages of pile surface in each EPA sub-area, by pile shape
+    ptot = np.empty((len(met), len(sources)))
+    asym = ~np.isnan(offset)
+    for sym, piles in [(False, asym), (True, ~asym)]:
+        if not piles.any():
+            continue
+        # all piles of the same shape are viewed, not copied
+        piles = slice(None) if piles.all() else piles
+        if sym:
+            ppsa = sympar(True, 1.0)
+        else:
+            ainc = met["wd"].to_numpy()[:, np.newaxis] - offset[piles]
+            ppsa = sympar(False, inc2alpha(ainc))
+        # building the emission in mcg (row-wise dot product)
+        dot = np.matmul(p[:, piles, np.newaxis, :], ppsa[..., np.newaxis])
+        ptot[:, piles] = dot[:, :, 0, 0]
+    ptot = ptot * (surface / 100.0) * 10**6.0
+    return ptot
+
+
+def scheme3(met, sources):
+    """Cumulus scheme to set emissions in absence of wind data."""
+    logger = logging.getLogger()
+    logger.debug("{}".format(scheme3.__doc__))
+
+    # emissions do not depend on meteorology: a single row for all hours
+    fac = np.empty((1, len(sources), len(DUST)))
+    for isou, sou in enumerate(sources):
+        if set(sou["species"]) != set(DUST):
+            raise ValueError(f"Invalid species in source {sou['id']}.")
+
+        listnw = ["radius", "height", "movh"]
+        conic = all(item in sou.keys() for item in listnw)
+        if conic:
+            r = sou["radius"]
+            h = sou["height"]
+            s = math.pi * r * math.sqrt(r**2 + h**2)
+            movh = sou["movh"]
+        else:
+            raise ValueError(f"Missing parameters in source {sou['id']}.")
 
-    # building the emission in mcg
-    ptot = np.zeros(len(p[:, 0]), float)
-    logger.debug(f"lenght of p = {len(p)}")
-    for ind in range(0, len(p)):
-        ptot[ind] = np.dot(p[ind, :], ppsa[ind, :]) * (s / 100.0) * 10**6.0
+        if h / (2 * r) > 0.2:
+            logger.debug("High mounds case.")
+            efpm25 = 1.26e-06
+            efpm10 = 7.9e-06
+            efpts = 1.6e-05
+        else:
+            logger.debug("Low mounds case.")
+            efpm25 = 3.8e-05
+            efpm10 = 2.5e-04
+            efpts = 5.1e-04
 
-    # building species name for met dataframe
-    pm25 = str(sou["id"]) + "_" + "PM25"
-    pm10 = str(sou["id"]) + "_" + "PM10"
-    pts = str(sou["id"]) + "_" + "PTS"
+        epm25 = (10**9) * efpm25 * s * movh
+        epm10 = (10**9) * efpm10 * s * movh
+        epts = (10**9) * efpts * s * movh
+        fac[:, isou, :] = [epm25, epm10, epts]
 
-    met.insert(len(met.columns), pm25, np.around(k25 * ptot, 2))
-    met.insert(len(met.columns), pm10, np.around(k10 * ptot, 2))
-    met.insert(len(met.columns), pts, np.around(kpts * ptot, 2))
-    return met
+    return fac
 
 
-def scheme3(met, conf, ind):
-    """Cumulus scheme to set emissions in absence of wind data."""
+# emission schemes applied to groups of sources
+SCHEMES = {1: odour, 2: scheme2, 3: scheme3}
+
+
+def factors(met, sources, profile=None, cache=None):
+    """Compute emission factors of all sources grouped by scheme."""
     logger = logging.getLogger()
-    logger.debug("{}".format(scheme2.__doc__))
-    sou = conf["sources"][ind]
-    if set(sou["species"]) != set(["PM25", "PM10", "PTS"]):
-        logger.info(f"Invalid species in source {sou['id']}: exit.")
-        sys.exit()
-
-    listnw = ["radius", "height", "movh"]
-    conic = all(item in sou.keys() for item in listnw)
-    if conic:
-        r = sou["radius"]
-        h = sou["height"]
-        s = math.pi * r * math.sqrt(r**2 + h**2)
-        movh = sou["movh"]
-    else:
-        logger.info(f"Missing parameters in source {sou['id']}: exit.")
-        sys.exit()
-
-    if h / (2 * r) > 0.2:
-        logger.debug("High mounds case.")
-        efpm25 = 1.26e-06
-        efpm10 = 7.9e-06
-        efpts = 1.6e-05
-    else:
-        logger.debug("Low mounds case.")
-        efpm25 = 3.8e-05
-        efpm10 = 2.5e-04
-        efpts = 5.1e-04
-
-    epm25 = (10**9) * efpm25 * s * movh
-    epm10 = (10**9) * efpm10 * s * movh
-    epts = (10**9) * efpts * s * movh
-    # building species name for met dataframe
-    pm25 = str(sou["id"]) + "_" + "PM25"
-    pm10 = str(sou["id"]) + "_" + "PM10"
-    pts = str(sou["id"]) + "_" + "PTS"
-
-    met.insert(len(met.columns), pm25, np.around(epm25, 2))
-    met.insert(len(met.columns), pm10, np.around(epm10, 2))
-    met.insert(len(met.columns), pts, np.around(epts, 2))
-
-    return met
+    logger.debug("{}".format(factors.__doc__))
+    if profile is None:
+        profile = Profile()
+
+    columns = [name for sou in sources for name in colnames(sou)]
+    duplicated = pd.Index(columns).duplicated()
+    if duplicated.any():
+        raise ValueError(
+            f"Duplicated source and species {columns[duplicated.argmax()]}."
+        )
+    # sources sharing the same parameters share the same factors
+    sources = uniquesources(sources)
+    logger.debug(f"{len(sources)} distinct sets of source parameters.")
+
+    # one matrix for factors varying in time and one row for constant ones,
+    # both with columns in configuration order
+    columns = {False: [], True: []}
+    cols = []
+    for sou in sources:
+        names = columns[sou["scheme"] in INVARIANT]
+        cols.append(slice(len(names), len(names) + len(colnames(sou))))
+        names += colnames(sou)
+    data = {
+        False: np.empty((len(met), len(columns[False]))),
+        True: np.empty((1, len(columns[True]))),
+    }
+    for scheme, func in SCHEMES.items():
+        isou = [i for i, sou in enumerate(sources) if sou["scheme"] == scheme]
+        if not isou:
+            continue
+        out = data[scheme in INVARIANT]
+        if cache is not None:
+            # load unchanged sources and compute only the missing ones
+            missing = []
+            for i in isou:
+                shape = (len(out), cols[i].stop - cols[i].start)
+                fac = cache.get(sources[i], shape)
+                if fac is None:
+                    missing.append(i)
+                else:
+                    out[:, cols[i]] = fac
+            isou = missing
+            if not isou:
+                continue
+        logger.debug(f"Scheme {scheme} applied to {len(isou)} sources.")
+        with profile.stage(f"scheme {scheme}", rows=len(out) * len(isou)):
+            fac = func(met, [sources[i] for i in isou])
+        for j, i in enumerate(isou):
+            out[:, cols[i]] = fac[:, j, :]
+            if cache is not None:
+                cache.put(sources[i], fac[:, j, :])
+    if cache is not None:
+        logger.info(
+            f"Factors of {cache.hits} sources loaded from cache,"
+            f" {cache.misses} computed."
+        )
+        if cache.misses:
+            cache.evict()
+    for values in data.values():
+        np.around(values, 2, out=values)
+
+    fac = pd.DataFrame(data[False], index=met.index, columns=pd.Index(columns[False]))
+    # time-invariant factors are expanded only in the output meteo file
+    fac.attrs["constants"] = dict(zip(columns[True], data[True][0].tolist()))
+    return fac
+
+
+def factorarrays(met, route):
+    """Factors of each position of a routing, scalars if time-invariant."""
+    return [factorcolumn(met, col) for col in route["columns"] + route["constants"]]
+
+
+def factorcolumn(met, col):
+    """Factors of a column at all hours, or a scalar if time-invariant."""
+    constants = met.attrs.get("constants", {})
+    if col in constants:
+        return constants[col]
+    return met[col].to_numpy()
+
+
+def factorpositions(fac, sources):
+    """Columns of all sources and their positions in the expanded factors."""
+    shared = sharedcolumns(sources)
+    names = [name for sou in sources for name in colnames(sou)]
+    # time-invariant factors follow the columns of the data frame
+    pos = {col: i for i, col in enumerate(fac.columns)}
+    for i, col in enumerate(fac.attrs.get("constants", {})):
+        pos[col] = len(fac.columns) + i
+    return names, [pos[shared[name]] for name in names]
+
+
+def expandfactors(fac, dtype="float64", rows=slice(None)):
+    """Compact factors followed by the time-invariant ones over all rows."""
+    values = fac.iloc[rows].to_numpy(dtype=dtype)
+    constants = np.array(list(fac.attrs.get("constants", {}).values()), dtype=dtype)
+    return np.hstack(
+        [values, np.broadcast_to(constants, (len(values), len(constants)))]
+    )
@@ -11,18 +11,26 @@ from pathlib import Path
 
 import tomllib
 
-from .emifile import aermod, calpuff, impact, pemtim
-from .met import readmet, writemet
+from .profiling import Profile
+from .sources import routing, sourceerrors
+
+# emission file writers of each model, in medea.emifile
+WRITERS = {
+    "spray": "pemtim",
+    "calpuff": "calpuff",
+    "impact": "impact",
+    "aermod": "aermod",
+}
 
 
 def check_model(input):
-    """ Check input model """
+    """Check input model"""
     logger = logging.getLogger()
     logger.debug("{}".format(check_model.__doc__))
 
     # List of valid models
     valid_models = ["spray", "calpuff", "impact", "aermod"]
-    
+
     try:
         # Convert it into integer
         val = int(input)
@@ -38,7 +46,8 @@ def check_model(input):
         elif val == 3:
             model = "aermod"
         else:
-            pass
+            # integers out of range are reported as invalid models
+            model = str(val)
     except ValueError:
         # Convert it into string
         model = str(input)
@@ -47,31 +56,23 @@ def check_model(input):
     finally:
         # Check if model is valid
         if model not in valid_models:
-            raise ValueError(f"Invalid model: {model}. Allowed models are {valid_models}")
+            raise ValueError(
+                f"Invalid model: {model}. Allowed models are {valid_models}"
+            )
         else:
             logger.debug(f"Model {model} is valid.")
 
     return model
 
 
-def readconf(cFile):
-    """Read toml configuration file."""
+def checksources(sources):
+    """Expand sources with a list of ids and validate their schemes."""
     logger = logging.getLogger()
-    logger.info("{}".format(readconf.__doc__))
-
-    # Load the TOML data into a Python dictionary
-    with open(cFile, "rb") as f:
-        conf = tomllib.load(f)
-
-    # debug information
-    logger.debug("Configuration toml file dump (key: value):")
-    for key in conf.keys():
-        logger.debug(f"{key}: {conf[key]}")
 
     newsou = []
-    for i, sou in enumerate(conf["sources"]):
+    for i, sou in enumerate(sources):
         if isinstance(sou["id"], list):
-            ids = conf["sources"][i]["id"]
+            ids = sources[i]["id"]
             tmpsou = []
             for j in range(len(ids)):
                 tmpsou.append(sou.copy())
@@ -79,47 +80,85 @@ def readconf(cFile):
                 tmpsou[k]["id"] = id
             newsou = newsou + tmpsou
     oldsou = []
-    for i, sou in enumerate(conf["sources"]):
+    for i, sou in enumerate(sources):
         if not isinstance(sou["id"], list):
-            oldsou.append(conf["sources"][i])
-    conf["sources"] = []
-    conf["sources"] = oldsou + newsou
-    logger.debug("Reading configuration file completed.")
+            oldsou.append(sources[i])
+    sources = oldsou + newsou
 
     # Validate schemes
     logger.debug("Validating sources schemes")
     valid_schemes = [1, 2, 3]
-    for i, sou in enumerate(conf["sources"]):
+    for i, sou in enumerate(sources):
         try:
             scheme = sou["scheme"]
         except Exception as e:
             raise Exception(f"Error reading scheme for source {i}. Error message: {e}.")
         if scheme not in valid_schemes:
-            raise ValueError(f"Invalid scheme \"{scheme}\" for source {sou["id"]}. Allowed schemes are {valid_schemes}")
+            raise ValueError(
+                f'Invalid scheme "{scheme}" for source {sou["id"]}. Allowed schemes are {valid_schemes}'
+            )
+
+    return sources
+
+
+def readconf(cFile):
+    """Read toml configuration file."""
+    logger = logging.getLogger()
+    logger.info("{}".format(readconf.__doc__))
+
+    # Load the TOML data into a Python dictionary
+    with open(cFile, "rb") as f:
+        conf = tomllib.load(f)
+
+    # debug information
+    logger.debug("Configuration toml file dump (key: value):")
+    for key in conf.keys():
+        logger.debug(f"{key}: {conf[key]}")
+
+    conf["sources"] = checksources(conf["sources"])
+    # source ids, species and factor positions shared by all writers
+    conf["routing"] = routing(conf["sources"])
+    logger.debug("Reading configuration file completed.")
 
     return conf
 
 
-def medea():
-    """
-    MEDEA main
-    """
+def modeltargets(conf):
+    """Configurations of all the emission files to edit."""
+    if "targets" not in conf.keys():
+        return [conf]
+    return [conf | target for target in conf["targets"]]
 
-    desc = "MEDEA: compute meteorolgy dependent emissions for dispersion models."
-    parser = argparse.ArgumentParser(description=desc)
 
-    parser.add_argument(
-        "config", type=str, help="Path to input configuration toml file."
-    )
-    parser.add_argument(
-        "-d", "--debug", help="Activate debug mode", action="store_true"
-    )
-    args = parser.parse_args()
+def configerrors(conf):
+    """Problems of the keys, model targets and sources of a configuration."""
+    errors = []
+    for key in ["windInputFile", "windOutputFile"]:
+        if key not in conf.keys():
+            errors.append(f"Missing {key} in configuration file.")
+    for i, target in enumerate(modeltargets(conf)):
+        missing = [key for key in ["mode", "input", "output"] if key not in target]
+        if missing:
+            errors.append(f"Missing {', '.join(missing)} in model target {i + 1}.")
+            continue
+        try:
+            mode = check_model(target["mode"])
+        except ValueError as e:
+            errors.append(f"{e}")
+            continue
+        if mode == "spray" and "pemspe" not in target.keys():
+            errors.append(f"Missing pemspe in model target {i + 1}.")
+    for sou in conf["sources"]:
+        errors += sourceerrors(sou)
+    return errors
+
 
+def setlogger(debug=False):
+    """Set console and file handlers of the logger."""
     # Create Logger
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    if args.debug:
+    if debug:
         logger.setLevel(logging.DEBUG)
 
     # Logging format
@@ -143,54 +182,202 @@ def medea():
     logger.info(f"Version {version("medea")}")
     logger.info("Licence: AGPL-3.0-or-later")
     logger.info("==========================")
+    return logger
+
+
+def run(conf, met, profile=None):
+    """Compute factors and edit the emission file of a configuration."""
+    from concurrent.futures import ProcessPoolExecutor
+
+    from .met import writemet, writemetchunks
+
+    logger = logging.getLogger()
+    if profile is None:
+        profile = Profile()
+
+    # write meteorological file
+    logger.info("Writing meteorological output file and")
+    logger.info("computing new emission rescaling factor.")
+    with profile.stage("writemet") as stage:
+        if "chunkSize" in conf.keys():
+            metout = writemetchunks(conf, met, profile)
+        else:
+            metout = writemet(conf, met, profile)
+        stage["rows"] = len(metout)
+
+    # Get modes and check their validity
+    targets = modeltargets(conf)
+    modes = [check_model(target["mode"]) for target in targets]
+
+    # read and write emission files
+    workers = int(conf["workers"]) if "workers" in conf.keys() else 1
+    # factors read from disk in chunked mode are not sent to other processes
+    if workers > 1 and len(targets) > 1 and "chunkSize" not in conf.keys():
+        logger.info(f"Editing emission files for {', '.join(modes)}")
+        with profile.stage("targets") as stage:
+            with ProcessPoolExecutor(max_workers=min(workers, len(targets))) as pool:
+                # each writer in its own process
+                rows = pool.map(
+                    writetarget,
+                    modes,
+                    [target | {"workers": 1} for target in targets],
+                    [metout] * len(targets),
+                )
+                stage["rows"] = sum(rows)
+    else:
+        for mode, target in zip(modes, targets):
+            logger.info(f"Editing emission file for {mode}")
+            with profile.stage(mode) as stage:
+                stage["rows"] = writetarget(mode, target, metout)
+    logger.info("Emission file edited.")
+    return modes
+
+
+def writetarget(mode, conf, met):
+    """Edit the emission file of a model."""
+    from . import emifile
+
+    return getattr(emifile, WRITERS[mode])(conf, met)
+
+
+def medea():
+    """
+    MEDEA main
+    """
+    if sys.argv[1:2] == ["batch"]:
+        from .batch import batch
+
+        return batch(sys.argv[2:])
+    if sys.argv[1:2] == ["sweep"]:
+        from .sweep import sweep
+
+        return sweep(sys.argv[2:])
+
+    desc = "MEDEA: compute meteorolgy dependent emissions for dispersion models."
+    epilog = (
+        "Run 'medea batch -h' to run many configuration files at once"
+        " and 'medea sweep -h' to evaluate sources over grids of parameters."
+    )
+    parser = argparse.ArgumentParser(description=desc, epilog=epilog)
+
+    parser.add_argument(
+        "config", type=str, help="Path to input configuration toml file."
+    )
+    parser.add_argument(
+        "-d", "--debug", help="Activate debug mode", action="store_true"
+    )
+    parser.add_argument(
+        "-V", "--version", action="version", version=f"%(prog)s {version("medea")}"
+    )
+    parser.add_argument(
+        "--validate",
+        help="Validate the configuration file and exit, without reading data",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--check",
+        help="Check configuration and input files and exit, reading only"
+        " headers and deadlines",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of worker processes (overrides workers in config file)",
+    )
+    parser.add_argument(
+        "-p",
+        "--profile",
+        help="Print time, memory and processed rows of each stage",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--profile-json",
+        type=str,
+        metavar="FILE",
+        help="Save the profile of each stage to a JSON file",
+    )
+    args = parser.parse_args()
+
+    logger = setlogger(args.debug)
+
+    profile = Profile()
 
     # read input configuration file
     try:
         logger.info("Reading input configuration file.")
         cFile = Path(args.config)
-        conf = readconf(cFile)
+        with profile.stage("readconf") as stage:
+            conf = readconf(cFile)
+            stage["rows"] = len(conf["sources"])
+        if args.jobs is not None:
+            conf["workers"] = args.jobs
     except Exception as e:
         logger.error(f"{e}")
-        sys.exit()
+        sys.exit(1)
 
-    # read meteorological file
+    if args.validate:
+        # keys and sources only, input files are checked by --check
+        errors = configerrors(conf)
+        for error in errors:
+            logger.error(error)
+        if errors:
+            logger.error(f"Configuration file {cFile} has {len(errors)} errors.")
+            sys.exit(1)
+        logger.info(f"Configuration file {cFile} is valid.")
+        logger.info("End of program.")
+        return
+
+    # scientific libraries are imported only when data are processed
+    from .met import readmet, readmetchunks
+    from .preflight import preflight
+
+    # check input files before reading and writing data
     try:
-        logger.info("Reading meteorological input file.")
-        met = readmet(conf)
+        with profile.stage("preflight"):
+            preflight(conf)
     except Exception as e:
         logger.error(f"{e}")
-        sys.exit()
+        sys.exit(1)
 
-    # write meteorological file
+    if args.check:
+        logger.info("End of program.")
+        return
+
+    # read meteorological file
     try:
-        logger.info("Writing meteorological output file and")
-        logger.info("computing new emission rescaling factor.")
-        metout = writemet(conf, met)
+        logger.info("Reading meteorological input file.")
+        with profile.stage("readmet") as stage:
+            if "chunkSize" in conf.keys():
+                # windows of meteo data are read while writing factors
+                met = readmetchunks(conf, int(conf["chunkSize"]))
+            else:
+                met = readmet(conf)
+                stage["rows"] = len(met)
     except Exception as e:
         logger.error(f"{e}")
-        sys.exit()
+        sys.exit(1)
 
-    # Get mode and check its validity
+    # compute factors and edit the emission file
     try:
-        mode = check_model(conf["mode"])
+        modes = run(conf, met, profile)
     except Exception as e:
         logger.error(f"{e}")
-        sys.exit()
+        sys.exit(1)
 
-    # read and write emission files
-    logger.info(f"Editing emission file for {mode}")
-    if mode == "spray":
-        pemtim(conf, metout)
-    elif mode == "calpuff":
-        calpuff(conf, metout)
-    elif mode == "impact":
-        impact(conf, metout)
-    elif mode == "aermod":
-        aermod(conf, metout)
-    else:
-        logger.error("No model has been recognized.")
-        sys.exit()
-    logger.info("Emission file edited.")
+    if args.profile or args.profile_json:
+        logger.info("Profile of the pipeline stages:")
+        for line in profile.summary():
+            logger.info(line)
+    if args.profile_json:
+        profile.save(
+            args.profile_json,
+            medea=version("medea"),
+            config=str(cFile),
+            mode=", ".join(modes),
+        )
+        logger.info(f"Profile saved to {args.profile_json}.")
 
     logger.info("End of program.")
     return
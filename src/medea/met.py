@@ -5,18 +5,85 @@
 #
 
 import logging
-import sys
-from datetime import datetime
+import struct
+import tempfile
+import zipfile
+from collections.abc import Hashable
+from pathlib import Path
+from typing import Any, cast
 
+import numpy as np
 import pandas as pd
 
-from .factor import odour, scheme2, scheme3
+from .cache import CACHESIZE, FactorCache, filehash
+from .compress import openfile
+from .factor import expandfactors, factorpositions, factors
+from .profiling import Profile
+
+# format of deadlines in meteo files
+DATEFMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# rows of the output meteo file formatted at once
+WRITECHUNK = 10000
+
+# binary formats of the output meteo file, by extension
+BINARY = [".npz", ".feather", ".parquet"]
+
+# columns of csv meteo files used by the schemes and their types
+METCOLS = ["date", "ws", "wd", "z", "stabclass"]
+METTYPES: dict[Hashable, Any] = {
+    "date": str,
+    "ws": np.float64,
+    "wd": np.float64,
+    "z": np.float64,
+    "stabclass": "category",
+}
+
+# stability classes given as numbers or lowercase letters
+STABCLASS = {
+    "1": "A",
+    "2": "B",
+    "3": "C",
+    "4": "D",
+    "5": "E",
+    "6": "F",
+    "a": "A",
+    "b": "B",
+    "c": "C",
+    "d": "D",
+    "e": "E",
+    "f": "F",
+}
 
 
 def readmet(conf):
     """Read meteo file in input."""
     logger = logging.getLogger()
     logger.info("{}".format(readmet.__doc__))
+    mettype = filetype(conf)
+    try:
+        met = metframe(metreader(conf, mettype), mettype)
+        logger.info(f"Read {mettype} meteo file.")
+    except Exception as e:
+        raise ValueError(f"Error reading {conf['windInputFile']}: {e}.") from e
+    checkdates(met.index, conf["windInputFile"])
+
+    return met
+
+
+def readmetchunks(conf, chunksize):
+    """Read meteo file in input, a window of rows at a time."""
+    logger = logging.getLogger()
+    logger.info("{}".format(readmetchunks.__doc__))
+    mettype = filetype(conf)
+    logger.info(f"Reading windows of {chunksize} rows.")
+    for raw in metreader(conf, mettype, chunksize):
+        yield metframe(raw, mettype)
+
+
+def filetype(conf):
+    """Type of the meteo file in input."""
+    logger = logging.getLogger()
     logger.info(f"Meteorological file is {conf["windInputFile"]}")
     try:
         mettype = str(conf["mettype"]).lower()
@@ -25,73 +92,331 @@ def readmet(conf):
         logger.error(f"The error is {e}.")
         logger.error("Setting meteo type to default value: csv.")
         mettype = "csv"
+    return mettype
+
 
+def metreader(conf, mettype, chunksize=None):
+    """Raw columns of the meteo file, at once or in chunks of rows."""
     if mettype == "postbin":
-        with open(conf["windInputFile"], "r") as file:
-            lines = [line.rstrip() for line in file]
-        metdata = [["none", -1.0, -1.0, -1.0] for x in range(len(lines))]
-        for ind in range(0, len(lines)):
-            line = lines[ind].split()
-            dtl = [int(line[j].replace(".", "")) for j in range(2, 8)]
-            date = datetime(2000 + dtl[2], dtl[1], dtl[0], dtl[3], dtl[4], dtl[5])
-            datestr = date.strftime("%Y-%m-%dT%H:%M:%SZ")
-            z = float(line[8])
-            ws = float(line[9])
-            wd = float(line[10])
-            metdata[ind] = [datestr, ws, wd, z]
-        met = pd.DataFrame(metdata, columns=["date", "ws", "wd", "z"])
-        logger.debug("Read postbin meteo file.")
+        # read day, month, year, hour, minute, second, z, ws, wd columns
+        # round_trip is missing from the annotations of pandas.read_csv
+        return pd.read_csv(  # pyright: ignore[reportCallIssue]
+            conf["windInputFile"],
+            sep=r"\s+",
+            header=None,
+            usecols=range(2, 11),
+            dtype=np.float64,
+            float_precision="round_trip",  # pyright: ignore[reportArgumentType]
+            chunksize=chunksize,
+        )
+    # read only the columns used by the schemes, with their types
+    return pd.read_csv(
+        conf["windInputFile"],
+        usecols=lambda col: col in METCOLS,
+        dtype=METTYPES,
+        chunksize=chunksize,
+    )
+
+
+def metframe(raw, mettype):
+    """Meteo data with timestamp index from the raw columns of a file."""
+    logger = logging.getLogger()
+    if mettype == "postbin":
+        raw = raw.to_numpy()
+        date = postbindates(raw)
+        met = pd.DataFrame(
+            {"date": date, "ws": raw[:, 7], "wd": raw[:, 8], "z": raw[:, 6]}
+        )
     else:
-        try:
-            # read input csv meteo file in a pandas dataframe
-            met = pd.read_csv(conf["windInputFile"])
-            if "stabclass" in met.keys():
-                met = met.replace(
-                    {
-                        "stabclass": {
-                            1: "A",
-                            2: "B",
-                            3: "C",
-                            4: "D",
-                            5: "E",
-                            6: "F",
-                            "a": "A",
-                            "b": "B",
-                            "c": "C",
-                            "d": "D",
-                            "e": "E",
-                            "f": "F",
-                        }
-                    }
-                )
-            logger.info("Read csv meteo file.")
-        except Exception as e:
-            logger.error(f"Error reading {conf['windInputFile']}.")
-            logger.error(f"{e}.")
-            sys.exit()
+        met = raw
+        met["date"] = parsedates(met["date"])
+        if "stabclass" in met.keys():
+            # rename the categories, not each value
+            met["stabclass"] = (
+                met["stabclass"]
+                .map(lambda c: STABCLASS.get(str(c), c))
+                .astype("category")
+            )
 
+    # build the timestamp index used to align meteo and emission data
+    logger.debug("Building the timestamp index of meteo data.")
+    met.index = pd.DatetimeIndex(met["date"], name="time")
     return met
 
 
-def writemet(conf, met):
+def postbindates(raw):
+    """Deadlines of postbin meteo files from their day to second columns."""
+    dtl = raw[:, 0:6].astype(np.int64)
+    return pd.to_datetime(
+        pd.DataFrame(
+            {
+                "year": 2000 + dtl[:, 2],
+                "month": dtl[:, 1],
+                "day": dtl[:, 0],
+                "hour": dtl[:, 3],
+                "minute": dtl[:, 4],
+                "second": dtl[:, 5],
+            }
+        )
+    )
+
+
+def metdates(conf):
+    """Deadlines of the meteo file in input, reading only their columns."""
+    mettype = str(conf["mettype"]).lower() if "mettype" in conf.keys() else "csv"
+    if mettype == "postbin":
+        raw = pd.read_csv(
+            conf["windInputFile"],
+            sep=r"\s+",
+            header=None,
+            usecols=range(2, 8),
+            dtype=np.float64,
+        )
+        return pd.DatetimeIndex(postbindates(raw.to_numpy()), name="time")
+    raw = pd.read_csv(conf["windInputFile"], usecols=pd.Index(["date"]), dtype=str)
+    return pd.DatetimeIndex(parsedates(raw["date"]), name="time")
+
+
+def checkdates(index, path):
+    """Check that deadlines of meteo data are not duplicated."""
+    if not index.is_unique:
+        dup = index[index.duplicated()][0]
+        raise ValueError(f"Duplicated date {dup.strftime(DATEFMT)} in {path}.")
+
+
+def parsedates(dates):
+    """Parse deadlines of meteo files into datetime64 values."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates)
+        if dates.dt.tz is not None:
+            # deadlines of meteo files are naive UTC times
+            dates = dates.dt.tz_convert("UTC").dt.tz_localize(None)
+        return dates
+    text = np.asarray(dates).astype(str)
+    if (np.strings.str_len(text) == 20).all() and np.strings.endswith(text, "Z").all():
+        # without the trailing Z the format is parsed by the fast ISO parser
+        return pd.to_datetime(text.astype("U19"), format=DATEFMT[:-1])
+    return pd.to_datetime(dates, format=DATEFMT)
+
+
+def metrow(met, date):
+    """Find the row position of meteo data for a given date."""
+    try:
+        return met.index.get_loc(date)
+    except KeyError:
+        raise ValueError(
+            f"Date {date.strftime(DATEFMT)} not found in meteorological data."
+        ) from None
+
+
+def writemet(conf, met, profile=None):
     """Write meteo file in output with rescaling factors."""
     logger = logging.getLogger()
     logger.info("{}".format(writemet.__doc__))
+    if profile is None:
+        profile = Profile()
+
+    cache = None
+    if "cacheDir" in conf.keys():
+        logger.info(f"Factor cache is {conf['cacheDir']}.")
+        maxsize = conf["cacheSize"] if "cacheSize" in conf.keys() else CACHESIZE
+        methash = filehash(conf["windInputFile"])
+        cache = FactorCache(conf["cacheDir"], methash, maxsize)
+
+    logger.debug("Computing rescaling factors of all sources.")
+    with profile.stage("factors", rows=len(met) * len(conf["sources"])):
+        fac = factors(met, conf["sources"], profile, cache)
 
-    logger.debug("Loop on selected sources to rescale emissions.")
-    for ind, sou in enumerate(conf["sources"]):
-        scheme = conf["sources"][ind]["scheme"]
-        logger.debug(f"Source = {sou}, scheme = {scheme}.")
+    # write the output meteo and factor file
+    logger.debug("Writing the output meteo and factor file.")
+    with profile.stage("windOutputFile", rows=len(met)):
+        if isbinary(conf["windOutputFile"]):
+            savefactors(conf["windOutputFile"], met, fac, conf["sources"])
+        else:
+            with openfile(conf["windOutputFile"], "w") as output:
+                writefactors(output, met, fac, conf["sources"])
+
+    met = pd.concat([met, fac], axis=1, copy=False)
+    met.attrs["constants"] = fac.attrs["constants"]
+    return met
 
-        if scheme == 1:
-            met = odour(met, conf, ind)
-        if scheme == 2:
-            met = scheme2(met, conf, ind)
-        if scheme == 3:
-            met = scheme3(met, conf, ind)
 
-    # write the output csv meteo and factor file
-    logger.debug("Writing the output csv meteo and factor file.")
-    met.to_csv(conf["windOutputFile"], index=False)
+def writemetchunks(conf, chunks, profile=None):
+    """Write meteo file in output with rescaling factors, a window at a time."""
+    logger = logging.getLogger()
+    logger.info("{}".format(writemetchunks.__doc__))
+    if profile is None:
+        profile = Profile()
+    if "cacheDir" in conf.keys():
+        logger.warning("The factor cache is not used with chunkSize.")
+    if isbinary(conf["windOutputFile"]):
+        raise ValueError("Binary windOutputFile cannot be written with chunkSize.")
 
+    # factors of all windows are stored on disk, next to the output file
+    if isinstance(conf["windOutputFile"], (str, Path)):
+        store = tempfile.TemporaryFile(
+            dir=Path(conf["windOutputFile"]).resolve().parent
+        )
+    else:
+        store = tempfile.TemporaryFile()
+    dates = []
+    columns = None
+    with (
+        profile.stage("windows") as stage,
+        openfile(conf["windOutputFile"], "w") as output,
+    ):
+        for met in chunks:
+            fac = factors(met, conf["sources"])
+            writefactors(output, met, fac, conf["sources"], header=not dates)
+            store.write(np.ascontiguousarray(fac.to_numpy()).tobytes())
+            dates.append(met.index.to_numpy())
+            columns = fac.columns
+        stage["rows"] = sum(len(d) for d in dates)
+    if columns is None:
+        raise ValueError(f"No meteorological data in {conf['windInputFile']}.")
+    index = pd.DatetimeIndex(np.concatenate(dates), name="time")
+    logger.info(f"{len(dates)} windows of meteo data processed.")
+    checkdates(index, conf["windInputFile"])
+
+    # factors are read back from disk by the writers only when needed
+    store.flush()
+    if len(columns) == 0:
+        # only time-invariant factors, nothing stored on disk
+        data = np.empty((len(index), 0))
+    else:
+        data = np.memmap(
+            store, dtype=np.float64, mode="r", shape=(len(index), len(columns))
+        )
+    met = pd.DataFrame(data, index=index, columns=columns, copy=False)
+    met.attrs["constants"] = fac.attrs["constants"]
     return met
+
+
+def isbinary(path):
+    """Check if the output meteo file is in binary format."""
+    if not isinstance(path, (str, Path)):
+        return False
+    return Path(path).suffix.lower() in BINARY
+
+
+def writefactors(f, met, fac, sources, header=True):
+    """Write meteo data and factor columns of all sources in csv format."""
+    # columns shared by sources with the same parameters are formatted once
+    names, pos = factorpositions(fac, sources)
+    if header:
+        columns = pd.DataFrame(columns=pd.Index(list(met.columns) + names))
+        f.write(columns.to_csv(index=False, lineterminator="\n"))
+    for start in range(0, len(met), WRITECHUNK):
+        rows = slice(start, start + WRITECHUNK)
+        lines = (
+            met.iloc[rows]
+            .to_csv(
+                index=False,
+                header=False,
+                date_format=DATEFMT,
+                lineterminator="\n",
+            )
+            .splitlines()
+        )
+        # same text of float values as pandas.DataFrame.to_csv
+        values = expandfactors(fac, rows=rows)
+        text = values.astype(str).astype(object)
+        text[np.isnan(values)] = ""
+        cells = cast(list[list[str]], text[:, pos].tolist())
+        for line, row in zip(lines, cells):
+            f.write(",".join([line] + row) + "\n")
+
+
+def savefactors(path, met, fac, sources):
+    """Save meteo data and factor columns of all sources in binary format."""
+    names, pos = factorpositions(fac, sources)
+    # factors in single precision, each column contiguous on disk
+    values = np.asfortranarray(expandfactors(fac, "float32")[:, pos])
+    if Path(path).suffix.lower() == ".npz":
+        arrays = {f"met_{col}": met[col].to_numpy() for col in met.columns}
+        if "stabclass" in met.columns:
+            arrays["met_stabclass"] = met["stabclass"].to_numpy(dtype=str)
+        # uncompressed, so that factors can be memory mapped
+        np.savez(
+            path,
+            metcolumns=np.array(met.columns, dtype=str),
+            columns=np.array(names, dtype=str),
+            factors=values,
+            **arrays,
+        )
+        return
+    frame = pd.concat(
+        [
+            met.reset_index(drop=True),
+            pd.DataFrame(values, columns=pd.Index(names), copy=False),
+        ],
+        axis=1,
+    )
+    if Path(path).suffix.lower() == ".feather":
+        frame.to_feather(path)
+    else:
+        frame.to_parquet(path, index=False)
+
+
+def loadfactors(path, mmap=True):
+    """Load meteo data and factors saved in binary format."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".npz":
+        with np.load(path) as data:
+            metcols = data["metcolumns"].tolist()
+            met = pd.DataFrame({col: data[f"met_{col}"] for col in metcols})
+            columns = data["columns"].tolist()
+            values = npzmemmap(path, "factors") if mmap else None
+            if values is None:
+                values = data["factors"]
+        if "stabclass" in met.columns:
+            met["stabclass"] = met["stabclass"].astype("category")
+        met.index = pd.DatetimeIndex(met["date"], name="time")
+        fac = pd.DataFrame(values, index=met.index, columns=columns, copy=False)
+        return pd.concat([met, fac], axis=1, copy=False)
+    if suffix == ".feather":
+        frame = pd.read_feather(path)
+    elif suffix == ".parquet":
+        frame = pd.read_parquet(path, memory_map=mmap)
+    else:
+        raise ValueError(f"Unknown binary format of {path}: use one of {BINARY}.")
+    frame.index = pd.DatetimeIndex(frame["date"], name="time")
+    return frame
+
+
+def npzmemmap(path, name):
+    """Memory map an array saved without compression in a npz file."""
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(f"{name}.npy")
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, "rb") as f:
+        # skip the local file header of the zip member
+        f.seek(info.header_offset)
+        local = f.read(30)
+        namelen, extralen = struct.unpack("<HH", local[26:30])
+        f.seek(info.header_offset + 30 + namelen + extralen)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=offset,
+        shape=shape,
+        order="F" if fortran else "C",
+    )
+
+
+def metrows(met, dates):
+    """Find the row positions of meteo data for an array of dates."""
+    metind = met.index.get_indexer(dates)
+    missing = metind < 0
+    if missing.any():
+        date = pd.DatetimeIndex(dates).strftime(DATEFMT)[missing.argmax()]
+        raise ValueError(f"Date {date} not found in meteorological data.")
+    return metind
@@ -0,0 +1,189 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import logging
+from datetime import timedelta
+from itertools import islice
+from pathlib import Path
+
+import pandas as pd
+
+from .compress import openfile
+from .emifile import (
+    aermoddate,
+    calpuffdate,
+    calpuffheader,
+    calpuffname,
+    pemspecies,
+    pemtimheader,
+    pemtimperiods,
+)
+from .medea import check_model, configerrors, modeltargets
+from .met import DATEFMT, checkdates, metdates
+from .sources import INVARIANT
+
+
+def preflight(conf, readdates=metdates):
+    """Check configuration and input files before processing data."""
+    logger = logging.getLogger()
+    logger.info("{}".format(preflight.__doc__))
+
+    errors = configerrors(conf)
+    errors += fileerrors(conf)
+    if not errors:
+        # only the deadlines of the meteo file are read
+        dates = readdates(conf)
+        try:
+            checkdates(dates, conf["windInputFile"])
+        except ValueError as e:
+            errors.append(f"{e}")
+        for target in modeltargets(conf):
+            errors += CHECKS[check_model(target["mode"])](target, dates)
+
+    for error in errors:
+        logger.error(error)
+    if errors:
+        raise ValueError(f"Pre-flight check failed with {len(errors)} errors.")
+    logger.info("Pre-flight check passed.")
+
+
+def fileerrors(conf):
+    """Problems of the input files and output folders of a configuration."""
+    errors = []
+    if "windInputFile" in conf.keys():
+        errors += patherrors(conf["windInputFile"])
+    if "windOutputFile" in conf.keys():
+        errors += patherrors(Path(conf["windOutputFile"]).resolve().parent)
+    for target in modeltargets(conf):
+        # targets with missing keys or invalid models are reported by configerrors
+        if not all(key in target for key in ["mode", "input", "output"]):
+            continue
+        try:
+            mode = check_model(target["mode"])
+        except ValueError:
+            continue
+        errors += patherrors(target["input"])
+        errors += patherrors(Path(target["output"]).resolve().parent)
+        if mode == "spray" and "pemspe" in target.keys():
+            errors += patherrors(target["pemspe"])
+    return errors
+
+
+def patherrors(path):
+    """Problems of a path that must exist."""
+    if not Path(path).exists():
+        return [f"File or folder {path} not found."]
+    return []
+
+
+def timevariant(conf):
+    """Ids of the sources with factors varying in time."""
+    route = conf["routing"]["sources"]
+    return {sou for sou, entry in route.items() if entry["scheme"] not in INVARIANT}
+
+
+def coverage(dates, metindex, path):
+    """Problems of emission deadlines missing in meteo data."""
+    dates = pd.DatetimeIndex(dates).unique()
+    missing = dates[~dates.isin(metindex)]
+    if len(missing) == 0:
+        return []
+    # the earliest missing date is reported
+    return [
+        f"Date {min(missing).strftime(DATEFMT)} of {path} not found in"
+        f" meteorological data ({len(missing)} dates missing)."
+    ]
+
+
+def spraycheck(conf, metindex):
+    """Check species and deadlines of a pemtim file."""
+    errors = []
+    lspe = pemspecies(conf["pemspe"])
+    for sou in conf["sources"]:
+        for spe in sou["species"]:
+            if spe not in lspe:
+                errors.append(
+                    f"Species {spe} of source {sou['id']} not in {conf['pemspe']}."
+                )
+    ids = timevariant(conf)
+    if not ids:
+        return errors
+
+    # hours from the reference date of the periods of configured sources
+    periods = set()
+    with openfile(conf["input"], "r") as file:
+        lines = (line.rstrip() for line in file)
+        header, refdate, nsou = pemtimheader(lines)
+        for sou, period, head, species in pemtimperiods(lines, nsou, len(lspe)):
+            if sou in ids:
+                periods.add(period)
+    dates = [refdate + timedelta(hours=period) for period in periods]
+    return errors + coverage(dates, metindex, conf["input"])
+
+
+def calpuffcheck(conf, metindex):
+    """Check species and deadlines of a calpuff emissions input."""
+    errors = []
+    route = conf["routing"]["sources"]
+    with openfile(conf["input"], "r") as file:
+        lines = (line.rstrip() for line in file)
+        head, nsou, nspe, lspe = calpuffheader(lines)
+
+        # configured sources in the first time block
+        block = [head[-1]] + list(islice(lines, nsou - 1))
+        names = {calpuffname(line) for line in block}
+        for sou, entry in route.items():
+            if sou in names and not all(spe in entry["species"] for spe in lspe[:nspe]):
+                errors.append(f"Missing emission factors for some species of {sou}.")
+        if not names & timevariant(conf):
+            return errors
+
+        # only the first line of each time block is parsed
+        dates = [calpuffdate(head[-2])]
+        dates += [calpuffdate(line) for line in islice(lines, 0, None, nsou + 1)]
+    return errors + coverage(dates, metindex, conf["input"])
+
+
+def impactcheck(conf, metindex):
+    """Check species and deadlines of an Impact emissions input."""
+    errors = []
+    columns = pd.read_csv(conf["input"], sep=";", nrows=0).columns
+    for sou in conf["sources"]:
+        for spe in sou["species"]:
+            if "Q_" + spe not in columns:
+                errors.append(f"'Q_{spe}' is missing in {conf['input']}.")
+    ids = timevariant(conf)
+    if not ids:
+        return errors
+
+    usecols = pd.Index(["SRCEID", "DATEDEB"])
+    file = pd.read_csv(conf["input"], sep=";", usecols=usecols)
+    rows = file["SRCEID"].isin(list(ids))
+    dates = pd.to_datetime(file.loc[rows, "DATEDEB"], format="%d-%m-%Y %H:%M:%S")
+    return errors + coverage(dates, metindex, conf["input"])
+
+
+def aermodcheck(conf, metindex):
+    """Check deadlines of an aermod emissions input."""
+    ids = timevariant(conf)
+    if not ids:
+        return []
+    deadlines = set()
+    with openfile(conf["input"], "r") as file:
+        for line in (row.split() for row in file):
+            if line and line[6] in ids:
+                deadlines.add(tuple(line[2:6]))
+    dates = [aermoddate(*deadline) for deadline in deadlines]
+    return coverage(dates, metindex, conf["input"])
+
+
+# checks of the emission files of each model
+CHECKS = {
+    "spray": spraycheck,
+    "calpuff": calpuffcheck,
+    "impact": impactcheck,
+    "aermod": aermodcheck,
+}
@@ -0,0 +1,77 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def maxrss():
+    """Peak resident set size of the process (MiB)."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on macOS, kilobytes elsewhere
+        rss = rss / 1024
+    return rss / 1024
+
+
+class Profile:
+    """Wall time, CPU time, memory and processed rows of pipeline stages."""
+
+    def __init__(self):
+        self.stages = []
+        self.depth = 0
+
+    @contextmanager
+    def stage(self, name, rows=None):
+        """Measure a stage; rows can be set on the yielded record."""
+        record = {"stage": name, "depth": self.depth, "rows": rows}
+        self.stages.append(record)
+        self.depth += 1
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall
+            record["cpu"] = time.process_time() - cpu
+            record["maxrss"] = maxrss()
+            self.depth -= 1
+
+    def summary(self):
+        """Lines of the summary table of all stages."""
+        lines = [
+            f"{'stage':<28s} {'wall (s)':>9s} {'cpu (s)':>9s}"
+            f" {'max RSS (MiB)':>14s} {'rows':>12s} {'rows/s':>12s}"
+        ]
+        for rec in self.stages:
+            name = "  " * rec["depth"] + rec["stage"]
+            rss = f"{rec['maxrss']:14.1f}" if rec["maxrss"] is not None else " " * 14
+            if rec["rows"] is not None:
+                rows = f"{rec['rows']:12d}"
+                rate = rec["rows"] / rec["wall"] if rec["wall"] > 0 else 0.0
+                rate = f"{rate:12.0f}"
+            else:
+                rows = rate = " " * 12
+            lines.append(
+                f"{name:<28s} {rec['wall']:9.3f} {rec['cpu']:9.3f} {rss} {rows} {rate}"
+            )
+        return lines
+
+    def save(self, path, **info):
+        """Write all stages and additional information to a JSON file."""
+        report = dict(info, stages=self.stages)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
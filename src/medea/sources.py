@@ -0,0 +1,179 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import json
+from itertools import product
+
+# dust species computed by schemes 2 and 3
+DUST = ["PM25", "PM10", "PTS"]
+
+
+# schemes with time-invariant factors, kept as scalars
+INVARIANT = [3]
+
+# terrain types of the odour scheme
+TERRAINS = ["rural", "urban"]
+
+# parameters of each scheme that can be swept
+SWEEP = {
+    1: ["height", "vref", "terrain"],
+    2: ["tfv", "roughness", "height"],
+    3: ["height"],
+}
+
+
+def factorspecies(sou):
+    """Species with emission factors computed for a source."""
+    if sou["scheme"] == 1:
+        return sou["species"][:1]
+    return DUST
+
+
+def sourceerrors(sou):
+    """Problems of the parameters of a source, checked before processing."""
+    errors = []
+    missing = [key for key in ["species"] if key not in sou.keys()]
+    if sou["scheme"] == 1:
+        missing += [key for key in ["height"] if key not in sou.keys()]
+        if "species" in sou.keys() and len(sou["species"]) != 1:
+            errors.append(
+                f"Invalid species {sou['species']} in source {sou['id']}:"
+                " a single species is required."
+            )
+        if "terrain" in sou.keys() and sou["terrain"] not in TERRAINS:
+            errors.append(
+                f"Invalid terrain \"{sou['terrain']}\" in source {sou['id']}."
+            )
+    elif "species" in sou.keys() and set(sou["species"]) != set(DUST):
+        errors.append(
+            f"Invalid species {sou['species']} in source {sou['id']}:"
+            " PM25, PM10 and PTS are all required."
+        )
+    if sou["scheme"] == 2:
+        missing += [key for key in ["tfv", "height"] if key not in sou.keys()]
+        asymmetric = all(key in sou.keys() for key in ["major", "minor", "angle"])
+        conical = "radius" in sou.keys()
+        if asymmetric == conical:
+            errors.append(f"Undefined shape of source {sou['id']}.")
+        elif asymmetric and "height" in sou.keys():
+            if abs(sou["angle"]) > 90.0:
+                errors.append(f"Bad angle {sou['angle']} of source {sou['id']}.")
+            if sou["major"] <= sou["minor"]:
+                errors.append(
+                    f"Bad geometry of source {sou['id']}:"
+                    f" major {sou['major']} <= minor {sou['minor']}."
+                )
+            if sou["height"] >= sou["minor"] / 2:
+                errors.append(
+                    f"Bad geometry of source {sou['id']}: height {sou['height']}"
+                    f" >= {sou['minor'] / 2} causes lateral slope over 45°."
+                )
+    if sou["scheme"] == 3:
+        missing += [
+            key for key in ["radius", "height", "movh"] if key not in sou.keys()
+        ]
+    if missing:
+        errors.insert(0, f"Missing {', '.join(missing)} in source {sou['id']}.")
+    return errors
+
+
+def colnames(sou):
+    """Names of the factor columns of a source."""
+    return [str(sou["id"]) + "_" + spe for spe in factorspecies(sou)]
+
+
+def normalize(value):
+    """Normalize a source parameter, so that 2 and 2.0 are the same value."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    return value
+
+
+def sourcekey(sou):
+    """Normalized parameters of a source, its id excluded."""
+    par = {k: normalize(v) for k, v in sou.items() if k != "id"}
+    return json.dumps(par, sort_keys=True)
+
+
+def uniquesources(sources):
+    """First source of each distinct set of parameters."""
+    unique = {}
+    for sou in sources:
+        unique.setdefault(sourcekey(sou), sou)
+    return list(unique.values())
+
+
+def sharedcolumns(sources):
+    """Map factor columns of all sources to the columns actually computed."""
+    unique = {}
+    shared = {}
+    for sou in sources:
+        first = unique.setdefault(sourcekey(sou), sou)
+        shared.update(zip(colnames(sou), colnames(first)))
+    return shared
+
+
+def routing(sources):
+    """Configuration, species and factor positions of each source id."""
+    shared = sharedcolumns(sources)
+    unique = uniquesources(sources)
+    columns = [
+        name
+        for sou in unique
+        if sou["scheme"] not in INVARIANT
+        for name in colnames(sou)
+    ]
+    constants = [
+        name for sou in unique if sou["scheme"] in INVARIANT for name in colnames(sou)
+    ]
+    # time-invariant factors follow the columns varying in time
+    pos = {name: i for i, name in enumerate(columns + constants)}
+    route = {}
+    for sou in sources:
+        # the first configuration of an id sets its scheme and species
+        if sou["id"] in route:
+            continue
+        species = {
+            spe: pos[shared[name]]
+            for spe, name in zip(factorspecies(sou), colnames(sou))
+        }
+        route[sou["id"]] = {"source": sou, "scheme": sou["scheme"], "species": species}
+    return {"columns": columns, "constants": constants, "sources": route}
+
+
+def sweepvalues(values):
+    """Values of a swept parameter, from a list or a start, stop, num range."""
+    if isinstance(values, dict):
+        start, stop, num = values["start"], values["stop"], int(values["num"])
+        if num < 2:
+            return [start]
+        return [start + i * (stop - start) / (num - 1) for i in range(num)]
+    if isinstance(values, list):
+        return values
+    return [values]
+
+
+def sweepgrid(sou):
+    """Parameter combinations of the sweep of a source."""
+    for key in sou["sweep"]:
+        if key not in SWEEP[sou["scheme"]]:
+            raise ValueError(
+                f'Parameter "{key}" of source {sou["id"]} cannot be swept.'
+                f" Allowed parameters are {SWEEP[sou['scheme']]}"
+            )
+    names = list(sou["sweep"])
+    values = [sweepvalues(sou["sweep"][key]) for key in names]
+    return [dict(zip(names, combo)) for combo in product(*values)]
+
+
+def sweepsources(sou, grid):
+    """Copies of a source with the parameters of each combination."""
+    base = {key: value for key, value in sou.items() if key != "sweep"}
+    return [base | par | {"id": f"{sou['id']}#{i}"} for i, par in enumerate(grid)]
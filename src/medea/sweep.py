@@ -0,0 +1,128 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from .medea import readconf, setlogger
+from .sources import factorspecies, sourceerrors, sweepgrid, sweepsources
+
+# statistics over time of the factors of each combination
+STATISTICS = ["min", "mean", "p50", "p95", "max"]
+
+
+def sweepfactors(met, sou):
+    """Factors of a source over its sweep: hours x combinations x species."""
+    from .factor import SCHEMES
+
+    grid = sweepgrid(sou)
+    sources = sweepsources(sou, grid)
+    errors = [error for combo in sources for error in sourceerrors(combo)]
+    if errors:
+        raise ValueError(errors[0])
+    # all combinations are evaluated at once by the scheme
+    fac = SCHEMES[sou["scheme"]](met, sources)
+    np.around(fac, 2, out=fac)
+    return grid, fac
+
+
+def sweepstats(fac):
+    """Statistics over time of the factors of each combination and species."""
+    return np.stack(
+        [
+            np.nanmin(fac, axis=0),
+            np.nanmean(fac, axis=0),
+            np.nanpercentile(fac, 50, axis=0),
+            np.nanpercentile(fac, 95, axis=0),
+            np.nanmax(fac, axis=0),
+        ],
+        axis=-1,
+    )
+
+
+def savesweep(path, met, results):
+    """Save the factors and statistics of all sweeps in npz format."""
+    arrays = {
+        "time": met.index.to_numpy(),
+        "sources": np.array([str(sou["id"]) for sou, _, _, _ in results]),
+        "statistics": np.array(STATISTICS),
+    }
+    for i, (sou, grid, fac, stats) in enumerate(results):
+        # a single row for time-invariant factors
+        arrays[f"source{i}_factors"] = fac.astype(np.float32)
+        arrays[f"source{i}_stats"] = stats
+        arrays[f"source{i}_species"] = np.array(factorspecies(sou))
+        arrays[f"source{i}_parameters"] = np.array(list(grid[0]))
+        for key in grid[0]:
+            arrays[f"source{i}_{key}"] = np.array([par[key] for par in grid])
+    np.savez(path, **arrays)
+
+
+def sweep(argv=None):
+    """Evaluate emission factors of sources over grids of parameters."""
+    desc = "MEDEA sweep: evaluate factors of sources over grids of parameters."
+    parser = argparse.ArgumentParser(prog="medea sweep", description=desc)
+    parser.add_argument(
+        "config", type=str, help="Path to input configuration toml file."
+    )
+    parser.add_argument(
+        "-d", "--debug", help="Activate debug mode", action="store_true"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        metavar="FILE",
+        help="Output npz file (overrides sweepOutputFile in config file)",
+    )
+    args = parser.parse_args(argv)
+
+    logger = setlogger(args.debug)
+
+    try:
+        conf = readconf(Path(args.config))
+        sweeps = [sou for sou in conf["sources"] if "sweep" in sou.keys()]
+        if not sweeps:
+            raise ValueError("No source with sweep in configuration file.")
+        if args.output is not None:
+            conf["sweepOutputFile"] = args.output
+        if "sweepOutputFile" not in conf.keys():
+            raise ValueError("Missing sweepOutputFile in configuration file.")
+    except Exception as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+
+    from .met import readmet
+
+    results = []
+    try:
+        met = readmet(conf)
+        for sou in sweeps:
+            grid, fac = sweepfactors(met, sou)
+            logger.info(f"Source {sou['id']}: {len(grid)} combinations evaluated.")
+            results.append((sou, grid, fac, sweepstats(fac)))
+    except Exception as e:
+        logger.error(f"{e}")
+        sys.exit(1)
+    savesweep(conf["sweepOutputFile"], met, results)
+    logger.info(f"Sweep saved to {conf['sweepOutputFile']}.")
+
+    # summary of the first species of each combination
+    logger.info("Summary of the sweep (first species):")
+    logger.info(f"{'source':<20s} {'parameters':<40s} {'mean':>12s} {'p95':>12s}")
+    for sou, grid, fac, stats in results:
+        for par, row in zip(grid, stats):
+            text = ", ".join(
+                f"{key}={value:g}" if isinstance(value, float) else f"{key}={value}"
+                for key, value in par.items()
+            )
+            logger.info(
+                f"{str(sou['id']):<20s} {text:<40s} {row[0, 1]:12.2f} {row[0, 3]:12.2f}"
+            )
+    logger.info("End of program.")
@@ -0,0 +1,35 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from medea import compute_factors, rewrite
+
+TESTS = Path(__file__).parent
+
+
+@pytest.fixture(scope="module")
+def met():
+    return pd.read_csv(TESTS / "windinput.csv")
+
+
+def test_rewrite_impact(met):
+    factors = compute_factors(
+        met, [{"id": 1, "scheme": 1, "species": ["OU"], "height": 5}]
+    )
+    impact = rewrite("impact", TESTS / "impact_input.csv", factors)
+    assert len(impact) == len(pd.read_csv(TESTS / "impact_input.csv", sep=";"))
+
+
+def test_rewrite_impact_missing_species(met):
+    factors = compute_factors(
+        met, [{"id": 1, "scheme": 1, "species": ["NOX"], "height": 5}]
+    )
+    with pytest.raises(ValueError, match="'Q_NOX' is missing"):
+        rewrite("impact", TESTS / "impact_input.csv", factors)
@@ -0,0 +1,45 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import pytest
+
+from medea.medea import check_model, configerrors
+
+SOURCES = [{"id": 1, "scheme": 1, "species": ["OU"], "height": 5}]
+
+
+def config(**keys):
+    """Configuration with a single odour source and the given keys."""
+    conf = {
+        "input": "impact_input.csv",
+        "output": "impact_output.csv",
+        "windInputFile": "windinput.csv",
+        "windOutputFile": "windoutput.csv",
+        "mode": "impact",
+        "sources": SOURCES,
+    }
+    return conf | keys
+
+
+@pytest.mark.parametrize("mode", [0, 1, 2, 3, "0", "SPRAY", "aermod"])
+def test_check_model_valid(mode):
+    assert check_model(mode) in ["spray", "calpuff", "impact", "aermod"]
+
+
+@pytest.mark.parametrize("mode", [7, -1, "7", "puff"])
+def test_check_model_invalid(mode):
+    with pytest.raises(ValueError, match="Invalid model"):
+        check_model(mode)
+
+
+def test_configerrors_valid():
+    assert configerrors(config()) == []
+
+
+def test_configerrors_out_of_range_mode():
+    errors = configerrors(config(mode=7))
+    assert len(errors) == 1
+    assert errors[0].startswith("Invalid model: 7.")
@@ -0,0 +1,38 @@
+#
+# SPDX-FileCopyrightText: 2023 Simularia s.r.l. <info@simualaria.it>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from medea import compute_factors
+from medea.sources import sourceerrors
+
+TESTS = Path(__file__).parent
+ODOUR = {"id": 1, "scheme": 1, "species": ["OU"], "height": 5}
+PILE = {"id": 2, "scheme": 2, "species": ["PTS", "PM25", "PM10"], "height": 4}
+
+
+def test_sourceerrors_valid():
+    assert sourceerrors(ODOUR) == []
+    assert sourceerrors(PILE | {"radius": 3, "tfv": 0.05}) == []
+
+
+def test_sourceerrors_missing_tfv():
+    assert sourceerrors(PILE | {"radius": 3}) == ["Missing tfv in source 2."]
+
+
+def test_sourceerrors_odour_species():
+    errors = sourceerrors(ODOUR | {"species": ["OU", "X"]})
+    assert len(errors) == 1
+    assert "a single species is required" in errors[0]
+
+
+def test_compute_factors_odour_species():
+    met = pd.read_csv(TESTS / "windinput.csv")
+    with pytest.raises(ValueError, match="a single species is required"):
+        compute_factors(met, [ODOUR | {"species": ["OU", "X"]}])